@@ -0,0 +1,305 @@
+"""Hardware-free benchmarks for the web server, DBWrapper and button callbacks.
+
+Runs against simulated GPIO and BME680 (SMARTHOME_FAKE_HW=1) in a temporary
+directory with its own .conf and database, so the real c2c1.db is never touched.
+
+    python benchmarks/run_benchmarks.py --devices 50 --history 100000 --out report.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+# Simulation muss vor dem ersten Import von led/buttons/webserver aktiv sein
+os.environ["SMARTHOME_FAKE_HW"] = "1"
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import fake_gpio  # noqa: E402
+from sensors import fake_bme680  # noqa: E402
+from db import DBWrapper  # noqa: E402
+
+TOKEN = "bench"
+ROOMS = 5
+
+
+def _summary(samples):
+    """Latency list (seconds) -> stats in milliseconds"""
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))] * 1000
+
+    total = sum(ordered)
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+        "p50_ms": round(pct(50), 3),
+        "p95_ms": round(pct(95), 3),
+        "p99_ms": round(pct(99), 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "throughput_rps": round(len(ordered) / total, 1) if total else None,
+    }
+
+
+def write_config(workdir, args):
+    with open(os.path.join(workdir, ".conf"), "w") as f:
+        f.write(f"""[DEFAULT]
+api_active = "true"
+access_token = "{TOKEN}"
+access_url = "http://127.0.0.1:5000"
+port = "5000"
+db_name = {os.path.join(workdir, "bench.db")}
+write_behind = "{'true' if args.write_behind else 'false'}"
+sensor_interval = "10"
+hardware_lock = "{os.path.join(workdir, '.hardware.lock')}"
+
+[SYSTEM]
+secret_key = "bench"
+system_id = "BENCH"
+connect2api = "false"
+""")
+    open(os.path.join(workdir, "api.conf"), "w").close()
+
+
+def seed_database(workdir, args):
+    """Devices, history and sensor readings at the requested sizes"""
+    db = DBWrapper(os.path.join(workdir, "bench.db"), write_behind=True)
+    db.init_db()
+    db.init_tables()
+    devices = []
+    for i in range(args.devices):
+        pin = 100 + i  # Simulation kennt keine Pin-Grenzen
+        db.add_device(f"bench-{i}", pin, 1, room_id=i % ROOMS + 1)
+        devices.append({"devicename": f"bench-{i}", "pin": pin, "type": "output"})
+    with open(os.path.join(workdir, "device.json"), "w") as f:
+        json.dump(devices, f)  # für /api/get/json (liest device.json)
+
+    now = int(time.time())
+    ids = [d["id"] for d in db.get_all_devices()]
+    # History über die letzten 30 Tage verteilt, in Blöcken schreiben
+    span = 30 * 86400
+    for start in range(0, args.history, 10000):
+        rows = []
+        for i in range(min(10000, args.history - start)):
+            device_id = random.choice(ids)
+            rows.append((now - span + (start + i) * span // max(args.history, 1), device_id, random.randint(0, 1), device_id))
+        db._write(lambda cur, rows=rows: cur.executemany(
+            "INSERT INTO history (timestamp, deviceID, state, roomID) "
+            "VALUES (datetime(?, 'unixepoch'), ?, ?, (SELECT roomID FROM device WHERE id = ?))", rows))
+    # Sensorwerte im Sampler-Abstand rückwärts ab jetzt
+    for i in range(args.sensor_rows):
+        db.insert_sensor_reading("bme680", {
+            "timestamp": now - (args.sensor_rows - i) * 10,
+            "temperature_c": 21 + random.uniform(-2, 2),
+            "humidity": 45 + random.uniform(-5, 5),
+            "pressure_hpa": 1011 + random.uniform(-1, 1),
+            "gas_ohms": 50000 + random.uniform(-500, 500),
+        })
+    db.close()
+
+
+def bench_http(client, args, pins):
+    """Sequential latency per endpoint, plus a concurrent run for throughput"""
+    now = int(time.time())
+    code = f"code={TOKEN}"
+    endpoints = {
+        "home": lambda i: "/",
+        "stats": lambda i: "/stats",
+        "switch": lambda i: f"/switch/{pins[i % len(pins)]}/",
+        "room": lambda i: f"/room/{i % ROOMS + 1}",
+        "api_get_json": lambda i: f"/api/get/json/?{code}",
+        "sensor_read": lambda i: f"/api/sensors/bme680?{code}",
+        "sensor_read_cached": lambda i: f"/api/sensors/bme680?{code}&max_age=5",
+        "sensor_history": lambda i: f"/api/sensors/bme680/history?{code}",
+        "sensor_history_30d": lambda i: f"/api/sensors/bme680/history?{code}&from={now - 30 * 86400}&resolution=auto",
+    }
+    results = {}
+    for name, url_for in endpoints.items():
+        requests = args.sensor_requests if name == "sensor_read" else args.requests
+        for i in range(min(5, requests)):
+            client.get(url_for(i))  # Warm-up (Template-Cache, Pool)
+        samples = []
+        statuses = {}
+        for i in range(requests):
+            if name == "sensor_read":
+                time.sleep(fake_bme680.refresh_time)  # Treiber-Puffer abwarten -> echte Messung
+            started = time.perf_counter()
+            response = client.get(url_for(i))
+            samples.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        results[name] = dict(_summary(samples), status=statuses)
+
+    # Parallele Leser: Durchsatz der Übersichtsseite mit mehreren Threads
+    per_thread = max(1, args.requests // args.concurrency)
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(per_thread):
+                client.get("/")
+        except Exception as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    started = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    elapsed = time.perf_counter() - started
+    results["home_concurrent"] = {
+        "threads": args.concurrency,
+        "requests": per_thread * args.concurrency,
+        "throughput_rps": round(per_thread * args.concurrency / elapsed, 1),
+        "errors": len(errors),
+    }
+    return results
+
+
+def bench_db_writes(workdir, args):
+    """Write throughput of DBWrapper, synchronous and write-behind"""
+    results = {}
+    for mode in ("sync", "write_behind"):
+        db = DBWrapper(os.path.join(workdir, f"writes-{mode}.db"), write_behind=(mode == "write_behind"))
+        db.init_db()
+        db.init_tables()
+        db.add_device("bench", 1, 1, room_id=1)
+        device_id = db.get_device(1)["id"]
+        now = int(time.time())
+        ops = {
+            "create_record": lambda i: db.create_record(device_id, i % 2),
+            "update_device_state_by_pin": lambda i: db.update_device_state_by_pin(1, i % 2),
+            "insert_sensor_reading": lambda i: db.insert_sensor_reading("bme680", {
+                "timestamp": now + i * 10, "temperature_c": 21.0, "humidity": 45.0,
+                "pressure_hpa": 1011.0, "gas_ohms": 50000.0}),
+            "write_log": lambda i: db.write_log("info", "bench", f"message {i}"),
+        }
+        results[mode] = {}
+        for name, op in ops.items():
+            started = time.perf_counter()
+            for i in range(args.writes):
+                op(i)
+            db.flush()  # erst wenn alles committed ist, zählt es
+            elapsed = time.perf_counter() - started
+            results[mode][name] = {"writes": args.writes, "secs": round(elapsed, 4),
+                                   "writes_per_sec": round(args.writes / elapsed, 1)}
+        db.close()
+    return results
+
+
+def bench_buttons(webserver, args):
+    """Edge on the input pin -> GPIO callback returns / output switched / state persisted"""
+    from buttons.switch_button import SwitchButton
+    from buttons.dispatcher import dispatcher
+
+    input_pin, output_pin = 900, 901
+    webserver.registry.add_device("bench-button-output", output_pin, 1, room_id=1)
+    persisted = threading.Event()
+
+    def on_batch(batch):
+        webserver._buttons_applied(batch)  # gleicher Weg wie im Betrieb (State + History)
+        persisted.set()
+
+    dispatcher.on_batch = on_batch
+    SwitchButton(input_pin, output_pin, bouncetime=0)
+    in_callback, to_output, to_persist = [], [], []
+    for _ in range(args.button_presses):
+        before = fake_gpio.input(output_pin)
+        persisted.clear()
+        # SwitchButton reagiert nur auf RISING -> Taste erst loslassen, dann drücken
+        fake_gpio.simulate_input(input_pin, fake_gpio.LOW)
+        started = time.perf_counter()
+        fake_gpio.simulate_input(input_pin, fake_gpio.HIGH)  # ruft den Callback synchron auf
+        in_callback.append(time.perf_counter() - started)
+        deadline = started + 1.0
+        while fake_gpio.input(output_pin) == before and time.perf_counter() < deadline:
+            time.sleep(0)
+        to_output.append(time.perf_counter() - started)
+        persisted.wait(1.0)
+        to_persist.append(time.perf_counter() - started)
+    dispatcher.on_batch = webserver._buttons_applied
+    return {
+        "edge_callback": _summary(in_callback),
+        "edge_to_output": _summary(to_output),
+        "edge_to_persist": _summary(to_persist),
+        "dispatcher": dispatcher.stats(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=20, help="number of output devices")
+    parser.add_argument("--history", type=int, default=20000, help="history rows to seed")
+    parser.add_argument("--sensor-rows", type=int, default=8640, help="sensor readings to seed (10 s apart)")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--sensor-requests", type=int, default=20, help="uncached sensor reads")
+    parser.add_argument("--concurrency", type=int, default=4, help="threads for the concurrent run")
+    parser.add_argument("--writes", type=int, default=2000, help="writes per DB operation")
+    parser.add_argument("--button-presses", type=int, default=200)
+    parser.add_argument("--sensor-delay", type=float, default=fake_bme680.measurement_delay,
+                        help="simulated BME680 measurement time in seconds")
+    parser.add_argument("--gpio-delay", type=float, default=0.0, help="simulated time per GPIO access in seconds")
+    parser.add_argument("--write-behind", action="store_true", help="run the app with write_behind = true")
+    parser.add_argument("--out", default="benchmark-report.json", help="JSON report path ('-' = stdout)")
+    args = parser.parse_args(argv)
+
+    fake_bme680.measurement_delay = args.sensor_delay
+    fake_gpio.io_delay = args.gpio_delay
+    out_path = os.path.abspath(args.out) if args.out != "-" else None
+
+    with tempfile.TemporaryDirectory(prefix="smarthome-bench-") as workdir:
+        write_config(workdir, args)
+        started = time.perf_counter()
+        seed_database(workdir, args)
+        seed_secs = time.perf_counter() - started
+
+        cwd = os.getcwd()
+        os.chdir(workdir)  # create_app liest .conf/api.conf/device.json aus dem Arbeitsverzeichnis
+        try:
+            # Debug-Ausgaben (print in Buttons/DB) nicht in den Report mischen
+            with contextlib.redirect_stdout(io.StringIO()):
+                import webserver
+                started = time.perf_counter()
+                webserver.create_app(start_services=False)
+                startup_secs = time.perf_counter() - started
+                webserver.LEDC.owns_gpio = True  # einziger Prozess auf der Simulation -> Shadow wie im Betrieb
+                client = webserver.app.test_client()
+                pins = [int(d["pin"]) for d in webserver.registry.get_all_devices()]
+                report = {
+                    "meta": {
+                        "timestamp": int(time.time()),
+                        "python": platform.python_version(),
+                        "platform": platform.platform(),
+                        "params": vars(args),
+                        "seed_secs": round(seed_secs, 3),
+                        "startup_secs": round(startup_secs, 3),
+                    },
+                    "http": bench_http(client, args, pins),
+                    "db_writes": bench_db_writes(workdir, args),
+                    "buttons": bench_buttons(webserver, args),
+                }
+                webserver.db.close()
+        finally:
+            os.chdir(cwd)
+
+    text = json.dumps(report, indent=2)
+    if out_path:
+        with open(out_path, "w") as f:
+            f.write(text + "\n")
+        print(f"Report written to {out_path}")
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    main()
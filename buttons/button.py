@@ -1,7 +1,17 @@
-import RPi.GPIO as GPIO
+from gpio import GPIO
+import led as LEDC
 
-# Generischer Button-Handler (Basis, Event -> trigger()).
-# Idee: Spezifische Buttons erben davon und implementieren trigger().
+from .dispatcher import dispatcher as default_dispatcher
+
+# Generischer Button-Handler (Basis, Event -> Queue -> apply()).
+# Idee: Spezifische Buttons erben davon und implementieren apply().
+# trigger() läuft im GPIO-Callback-Thread und stellt nur ein Event in die Queue.
+
+def setup_inputs(pins):
+    """Configure several button inputs (pull-down) in one GPIO call"""
+    if pins:
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(list(pins), GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
 
 class GenericButtonHandler:
     """Base class for button logic (GPIO event)"""
@@ -10,18 +20,22 @@ class GenericButtonHandler:
         input_pin, 
         output_pin, 
         event=GPIO.RISING, 
-        bouncetime=200
+        bouncetime=200,
+        dispatcher=None,
+        setup_pins=True
     ):
         self.input_pin = input_pin
         self.output_pin = output_pin
         self.event = event
         self.bouncetime = bouncetime
+        self.dispatcher = dispatcher or default_dispatcher
 
-    # Pin setup (input with pull-down + output LOW)
-        GPIO.setmode(GPIO.BCM)  # BCM-Nummern
-        GPIO.cleanup(input_pin)  # Input-Pin einmal sauber machen
-        GPIO.setup(self.input_pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
-        GPIO.setup(self.output_pin, GPIO.OUT, initial=GPIO.LOW)
+    # Pin setup (input with pull-down + output LOW); beim Restore schon gesammelt erledigt
+        if setup_pins:
+            GPIO.setmode(GPIO.BCM)  # BCM-Nummern
+            GPIO.cleanup(input_pin)  # Input-Pin einmal sauber machen
+            GPIO.setup(self.input_pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+            LEDC.setup_led(self.output_pin, initial=GPIO.LOW)  # Output LOW (+ Shadow-Register)
 
     # Default event registration
         self.setup_event_detection()  # Event-Callback aktivieren
@@ -38,5 +52,9 @@ class GenericButtonHandler:
         )
 
     def trigger(self, pin):
-        """Implemented by concrete button class"""
-        pass
+        """GPIO callback: only enqueue (must never block the edge thread)"""
+        self.dispatcher.submit(self)
+
+    def apply(self, event):
+        """Implemented by concrete button class (dispatcher thread) -> new output state"""
+        return None
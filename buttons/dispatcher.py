@@ -0,0 +1,87 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import metrics
+
+# Button-Events: der GPIO-Callback legt nur ein Event in die Queue (blockiert nie),
+# ein eigener Thread schaltet die Outputs der Reihe nach und meldet die Änderungen
+# gesammelt an on_batch (Webserver: State + History in einer Transaktion, SSE).
+
+ButtonEvent = namedtuple("ButtonEvent", "handler input_pin output_pin timestamp")
+
+
+class ButtonDispatcher:
+    """Queue between the GPIO edge thread and output/state/history updates"""
+    def __init__(self, max_batch=50, max_latency=0.02, max_queue=1000):
+        self.max_batch = max_batch      # so viele Events höchstens pro Transaktion
+        self.max_latency = max_latency  # so lange auf weitere Events warten (Sekunden)
+        self.on_batch = None  # callback([(event, new_state), ...]) im Dispatcher-Thread
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.processed = 0
+        self.dropped = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="button-dispatcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, handler):
+        """Called from the GPIO callback: timestamp + enqueue, nothing else"""
+        event = ButtonEvent(handler, handler.input_pin, handler.output_pin, time.time())
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1  # lieber verwerfen als den Edge-Thread blockieren
+            metrics.BUTTON_EVENTS.inc(result="dropped")
+            return False
+        if self._thread is None:
+            self.start()
+        return True
+
+    def _apply(self, event):
+        metrics.BUTTON_QUEUE_DELAY.observe(max(0.0, time.time() - event.timestamp))
+        try:
+            state = event.handler.apply(event)
+        except Exception as e:
+            print(f"Button event on pin {event.input_pin} failed: {e}")
+            metrics.BUTTON_EVENTS.inc(result="failed")
+            return None
+        self.processed += 1
+        metrics.BUTTON_EVENTS.inc(result="processed")
+        return (event, state)
+
+    def _loop(self):
+        while True:
+            # Erstes Event sofort schalten, danach kurz weitere einsammeln (Doppelklick, Prellen)
+            batch = [self._apply(self._queue.get())]
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(self._apply(event))
+            batch = [item for item in batch if item is not None]
+            if batch and self.on_batch is not None:
+                try:
+                    self.on_batch(batch)
+                except Exception as e:
+                    print(f"Saving button events failed: {e}")
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "processed": self.processed,
+            "dropped": self.dropped,
+        }
+
+
+dispatcher = ButtonDispatcher()  # eine gemeinsame Instanz für alle Buttons
@@ -1,20 +1,23 @@
-import RPi.GPIO as GPIO
+from gpio import GPIO
+import led as LEDC
 from .button import GenericButtonHandler 
 
 # Momentary button: kurz drücken = Output HIGH (einmalig)
 
 class PressButton(GenericButtonHandler):
-    def __init__(self, input_pin, output_pin, bouncetime=200):
+    def __init__(self, input_pin, output_pin, bouncetime=200, dispatcher=None, setup_pins=True):
         # We want to catch both RISING and FALLING so we can 
         # handle the pin going high (button press) and low (button release).
         super().__init__(
             input_pin=input_pin,
             output_pin=output_pin,
             event=GPIO.BOTH,
-            bouncetime=bouncetime
+            bouncetime=bouncetime,
+            dispatcher=dispatcher,
+            setup_pins=setup_pins
         )
 
-    def trigger(self, pin):
+    def apply(self, event):
         # Simple: immer HIGH setzen (kurzer Impuls)
-        print(f"triggered push button on {self.input_pin}")
-        GPIO.output(self.output_pin, GPIO.HIGH)
+        LEDC.set.led_on(self.output_pin)
+        return True
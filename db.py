@@ -1,5 +1,9 @@
 import sqlite3
+import queue
+import threading
+import atexit
 from collections import defaultdict
+from contextlib import contextmanager
 import time as t
 
 from exceptions import DeviceTypeNotFoundException, DeviceNotFoundException
@@ -7,13 +11,159 @@ from exceptions import DeviceTypeNotFoundException, DeviceNotFoundException
 # DB-Wrapper für die Geräteverwaltung (kleines, simples SQLite-Setup).
 # Ich halte es bewusst schlank, damit man es als Azubi schnell versteht.
 
+# Messwerte, die wir pro Sensor speichern und verdichten
+SENSOR_FIELDS = ("temperature_c", "humidity", "pressure_hpa", "gas_ohms")
+# Rollup-Stufen: Name -> Bucket-Größe in Sekunden (fein -> grob)
+SENSOR_ROLLUPS = (("minute", 60), ("hour", 3600), ("day", 86400))
+# Hochzählen, sobald sich init_tables ändert (steht in PRAGMA user_version)
+SCHEMA_VERSION = 8
+# Zähler über history: scope -> Ausdruck für den Schlüssel (NEW. = eingefügte/gelöschte Zeile)
+HISTORY_COUNTER_SCOPES = {
+    "total": "0",
+    "device": "COALESCE({row}.deviceID, 0)",
+    "room": "COALESCE({row}.roomID, 0)",  # Raum beim Eintragen, nicht der aktuelle des Geräts
+    "day": "date({row}.timestamp)",
+}
+# Nutzungs-Auswertung pro Gerät (Ein-Zeit, Schaltvorgänge): Name -> Bucket-Größe in Sekunden
+USAGE_BUCKETS = (("hour", 3600), ("day", 86400))
+# Datenarten mit eigenem Änderungszähler (ETag/304 im Webserver)
+DATA_KINDS = ("device", "history", "sensor")
+# Tabellen mit Aufbewahrungsfrist -> (Zeitspalte, Zeitspalte ist Unix-Timestamp)
+RETENTION_TABLES = {
+    "logs": ("timestamp", False),
+    "history": ("timestamp", False),
+    "sensor_readings": ("timestamp", False),
+    "sensor_rollup_minute": ("bucket", True),
+    "sensor_rollup_hour": ("bucket", True),
+    "sensor_rollup_day": ("bucket", True),
+}
+
+def _utc_now(ts=None):
+    """Timestamp in SQLite CURRENT_TIMESTAMP format (UTC); ts = unix time, default now"""
+    return t.strftime('%Y-%m-%d %H:%M:%S', t.gmtime(ts))
+
+
+class _WriteJob:
+    """One unit of work for the writer (runs in its own savepoint)"""
+    def __init__(self, fn, wait=False, raw=False, touches=()):
+        self.fn = fn
+        self.raw = raw  # True: außerhalb jeder Transaktion ausführen (VACUUM & Co.)
+        self.touches = touches  # Datenarten, deren Version nach dem Commit hochzählt
+        self.done = threading.Event() if (wait or raw) else None
+        self.result = None
+        self.error = None
+
+
+class _UsageAccumulator:
+    """Turns state transitions into on-seconds/switch counts per hour and day bucket"""
+    def __init__(self, last=None):
+        self.last = dict(last or {})  # device_id -> (state, since)
+        self.deltas = defaultdict(lambda: [0.0, 0])  # (name, device_id, bucket) -> [on_seconds, switches]
+
+    def add(self, device_id, state, ts):
+        on = 1 if state else 0
+        previous = self.last.get(device_id)
+        if previous is not None and previous[0] and ts > previous[1]:
+            # Gerät war seit "since" an -> Zeit auf alle berührten Buckets verteilen
+            for name, bucket_sec in USAGE_BUCKETS:
+                for bucket, seconds in _split_interval(previous[1], ts, bucket_sec):
+                    self.deltas[(name, device_id, bucket)][0] += seconds
+        if previous is None or previous[0] != on:
+            for name, bucket_sec in USAGE_BUCKETS:
+                self.deltas[(name, device_id, ts - ts % bucket_sec)][1] += 1
+        since = max(ts, previous[1]) if previous is not None else ts  # Ausreißer in der Zeit nicht rückwärts
+        self.last[device_id] = (on, since)
+
+    def write(self, cur):
+        for name, _ in USAGE_BUCKETS:
+            rows = [(device_id, bucket, on_sec, switches)
+                    for (tier, device_id, bucket), (on_sec, switches) in self.deltas.items() if tier == name]
+            cur.executemany(f"""
+                INSERT INTO device_usage_{name} (device_id, bucket, on_seconds, switch_count)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (device_id, bucket) DO UPDATE SET
+                    on_seconds = on_seconds + excluded.on_seconds,
+                    switch_count = switch_count + excluded.switch_count;
+            """, rows)
+        cur.executemany("""
+            INSERT OR REPLACE INTO device_usage_state (device_id, state, since) VALUES (?, ?, ?);
+        """, [(device_id, state, since) for device_id, (state, since) in self.last.items()])
+
+
+class _RollupBuffer:
+    """Sensor samples folded into minute/hour/day aggregates in memory until the next flush"""
+    def __init__(self):
+        self.entries = {}  # (name, sensor_type, bucket) -> [samples, [min, max, sum] pro Feld]
+        self.open_minute = {}  # sensor_type -> Minuten-Bucket, der gerade gesammelt wird
+
+    def add(self, sensor_type, ts, reading):
+        """Fold one sample in -> True if it starts a new minute (the previous one is closed)"""
+        for name, bucket_sec in SENSOR_ROLLUPS:
+            key = (name, sensor_type, ts - ts % bucket_sec)
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = [0, [[None, None, None] for _ in SENSOR_FIELDS]]
+            entry[0] += 1
+            for agg, field in zip(entry[1], SENSOR_FIELDS):
+                value = reading.get(field)
+                if value is None:
+                    continue  # fehlender Wert zählt nicht in min/max/sum
+                agg[0] = value if agg[0] is None else min(agg[0], value)
+                agg[1] = value if agg[1] is None else max(agg[1], value)
+                agg[2] = value if agg[2] is None else agg[2] + value
+        minute = ts - ts % SENSOR_ROLLUPS[0][1]
+        previous = self.open_minute.get(sensor_type)
+        self.open_minute[sensor_type] = minute
+        return previous is not None and previous != minute
+
+    def take(self):
+        """Pending aggregates as rows for the UPSERT; buffer is empty afterwards"""
+        rows = [
+            (name, sensor_type, bucket, samples, [value for agg in aggs for value in agg])
+            for (name, sensor_type, bucket), (samples, aggs) in self.entries.items()
+        ]
+        self.entries = {}
+        return rows
+
+
+def _split_interval(start, end, bucket_sec):
+    """[start, end) -> (bucket, seconds) per touched bucket"""
+    while start < end:
+        bucket = start - start % bucket_sec
+        stop = min(end, bucket + bucket_sec)
+        yield bucket, stop - start
+        start = stop
+
+
 class DBWrapper:
-    def __init__(self, db_name):
+    def __init__(self, db_name, write_behind=False, batch_size=100, max_latency=0.05,
+                 read_pool_size=4, busy_timeout=5.0):
         self.db_name = db_name
-        self.connection = None
+        self.connection = None  # einzige Schreib-Verbindung
         self.cur = None
         # DB ist am Anfang noch nicht verbunden
 
+        # Leser kommen aus einem kleinen Pool, damit sie nicht hinter dem Writer warten (WAL)
+        self.read_pool_size = read_pool_size
+        self.busy_timeout = busy_timeout  # Sekunden, die SQLite bei Locks wartet
+        self._read_pool = queue.LifoQueue()
+        self._readers_created = 0
+        self._pool_lock = threading.Lock()
+
+        # Write-behind: ein Writer-Thread sammelt Schreibjobs und committet gebündelt.
+        # Nicht bei :memory: -> die eigene Verbindung des Writers wäre eine zweite, leere DB
+        self.write_behind = write_behind and db_name != ":memory:"
+        self.batch_size = batch_size
+        self.max_latency = max_latency  # max. Sekunden bis ein Job committet ist
+        self._write_lock = threading.Lock()
+        self._write_queue = None
+        self._writer_thread = None
+
+        # Sensor-Rollups erst im Speicher sammeln; geschrieben wird nur, wenn eine Minute
+        # abgeschlossen ist oder ohnehin ein Rohwert gespeichert wird (Deadband/Heartbeat)
+        self._rollups = _RollupBuffer()
+        self._rollup_lock = threading.Lock()
+
     def dict_factory(self, cursor, row):
         """Rows -> dict (column_name: value)"""
         d = {}
@@ -29,17 +179,237 @@ class DBWrapper:
             history_by_minute[minute].append(row)
         return dict(history_by_minute)
 
-    def create_db(self):
-        """Establish connection (one-time)"""
+    def pick_sensor_resolution(self, span_sec: int, max_points: int = 300, raw_interval: int = 10):
+        """Finest tier that returns at most ~max_points rows for the span"""
+        if span_sec / max(raw_interval, 1) <= max_points:
+            return "raw"
+        for name, bucket_sec in SENSOR_ROLLUPS:
+            if span_sec / bucket_sec <= max_points:
+                return name
+        return SENSOR_ROLLUPS[-1][0]  # gröber als "day" gibt es nicht
+
+    def _connect(self, **kwargs):
+        """New connection with row factory and busy timeout"""
         # check_same_thread=False, damit wir die Verbindung auch aus Flask-Threads nutzen können
-        self.connection = sqlite3.connect(self.db_name, check_same_thread=False)
-        self.connection.row_factory = self.dict_factory
+        connection = sqlite3.connect(self.db_name, check_same_thread=False, timeout=self.busy_timeout, **kwargs)
+        connection.row_factory = self.dict_factory
+        return connection
+
+    def create_db(self):
+        """Establish writer connection (one-time); readers come from the pool"""
+        self.connection = self._connect()
         self.cur = self.connection.cursor()
+        # Muss vor journal_mode=WAL kommen: das legt den Datei-Header an, danach wirkt auto_vacuum
+        # nur noch über ein VACUUM. Neue DB -> gleich inkrementell; bestehende DB bleibt, wie sie ist
+        # (RetentionJob stellt sie einmalig per VACUUM um)
+        self.cur.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+        if self.db_name != ":memory:":
+            # WAL: Leser sehen committete Daten, während geschrieben wird (bleibt in der DB-Datei gesetzt)
+            self.cur.execute("PRAGMA journal_mode=WAL;")
+        if self.write_behind:
+            self.cur.execute("PRAGMA synchronous=NORMAL;")
+        else:
+            # Write-behind räumt über close() auf; sonst gepufferte Rollups beim Beenden schreiben
+            atexit.register(self.flush_sensor_rollups)
         return self.cur
 
+    # ---------------------- read path ----------------------
+
+    @contextmanager
+    def _reader(self):
+        """Borrow a read cursor from the pool"""
+        if self.db_name == ":memory:":
+            # In-Memory-DB gibt es nur in dieser einen Verbindung -> Writer mitbenutzen
+            with self._write_lock:
+                yield self.connection.cursor()
+            return
+        try:
+            connection = self._read_pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                create = self._readers_created < self.read_pool_size
+                if create:
+                    self._readers_created += 1
+            if create:
+                connection = self._connect()
+            else:
+                try:
+                    connection = self._read_pool.get(timeout=self.busy_timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError("no read connection available")
+        try:
+            yield connection.cursor()
+        finally:
+            if connection.in_transaction:
+                connection.rollback()
+            self._read_pool.put(connection)
+
+    def _query(self, sql, params=()):
+        """Run a read query on a pooled connection -> all rows"""
+        with self._reader() as cur:
+            return cur.execute(sql, params).fetchall()
+
+    def _query_one(self, sql, params=()):
+        """Run a read query on a pooled connection -> first row or None"""
+        with self._reader() as cur:
+            return cur.execute(sql, params).fetchone()
+
+    # ---------------------- write path ----------------------
+
+    def _bump(self, cur, touches):
+        """Count a change for each data kind (same transaction as the write itself)"""
+        if not touches:
+            return
+        placeholders = ",".join("?" * len(touches))
+        cur.execute(f"""
+            UPDATE change_counters SET n = n + 1, changed_at = ? WHERE kind IN ({placeholders});
+        """, (t.time(), *touches))
+
+    def data_version(self, *kinds):
+        """(version string, unix time of last change) over the given data kinds"""
+        # Zähler liegen in der DB -> jeder Prozess sieht dieselbe Version
+        placeholders = ",".join("?" * len(kinds))
+        rows = {
+            row["kind"]: row for row in self._query(f"""
+                SELECT kind, n, changed_at FROM change_counters WHERE kind IN ({placeholders});
+            """, kinds)
+        }
+        version = "-".join(str(rows[kind]["n"]) if kind in rows else "0" for kind in kinds)
+        changed_at = max((row["changed_at"] for row in rows.values()), default=0.0)
+        return version, changed_at
+
+    def _write(self, fn, wait=False, raw=False, touches=()):
+        """Run fn(cur) as one write job; queued in write-behind mode"""
+        if not self.write_behind:
+            with self._write_lock:
+                try:
+                    if raw:
+                        self.connection.commit()  # VACUUM & Co. gehen nicht in einer Transaktion
+                    result = fn(self.cur)
+                    self._bump(self.cur, touches)
+                    self.connection.commit()
+                except Exception:
+                    self.connection.rollback()
+                    raise
+                return result
+
+        self._start_writer()
+        job = _WriteJob(fn, wait, raw, touches)
+        self._write_queue.put(job)
+        if job.done is None:
+            return None
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _start_writer(self):
+        """Start writer thread once (lazy)"""
+        with self._write_lock:
+            if self._writer_thread is not None:
+                return
+            self._write_queue = queue.Queue()
+            self._writer_thread = threading.Thread(target=self._writer_loop, name="db-writer", daemon=True)
+            self._writer_thread.start()
+            atexit.register(self.close)  # beim Beenden noch alles wegschreiben
+
+    def _writer_loop(self):
+        """Drain queue and commit in batches (bounded by batch_size/max_latency)"""
+        # Eigene Verbindung im Autocommit-Modus, Transaktionen steuern wir selbst
+        connection = self._connect(isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL;")
+        connection.execute("PRAGMA synchronous=NORMAL;")
+        cur = connection.cursor()
+        running = True
+        while running:
+            job = self._write_queue.get()
+            if job is None:
+                break
+            batch = [job]
+            deadline = t.monotonic() + self.max_latency
+            # Weitere Jobs einsammeln, bis Batch voll, Zeit um oder jemand wartet
+            while len(batch) < self.batch_size and batch[-1].done is None:
+                remaining = deadline - t.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self._write_queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if job is None:
+                    running = False
+                    break
+                batch.append(job)
+            self._commit_batch(cur, batch)
+        connection.close()
+
+    def _commit_batch(self, cur, batch):
+        """Execute jobs in one transaction, each isolated by a savepoint"""
+        # raw-Jobs warten immer -> stehen nur am Ende eines Batches und laufen nach dem COMMIT
+        raw_jobs = [job for job in batch if job.raw]
+        batch = [job for job in batch if not job.raw]
+        if batch:
+            self._run_transaction(cur, batch)
+        for job in raw_jobs:
+            try:
+                job.result = job.fn(cur)
+                self._bump(cur, job.touches)
+            except Exception as e:
+                job.error = e
+            job.done.set()
+
+    def _run_transaction(self, cur, batch):
+        try:
+            cur.execute("BEGIN;")
+            for job in batch:
+                cur.execute("SAVEPOINT job;")
+                try:
+                    job.result = job.fn(cur)
+                    self._bump(cur, job.touches)  # im Savepoint -> fällt mit dem Job zurück
+                    cur.execute("RELEASE job;")
+                except Exception as e:
+                    cur.execute("ROLLBACK TO job;")
+                    cur.execute("RELEASE job;")
+                    job.error = e
+                    if job.done is None:
+                        print(f"DB write failed: {e}")  # niemand wartet drauf -> wenigstens loggen
+            cur.execute("COMMIT;")
+        except Exception as e:
+            if cur.connection.in_transaction:
+                cur.execute("ROLLBACK;")
+            for job in batch:
+                job.error = job.error or e
+            print(f"DB batch commit failed: {e}")
+        for job in batch:
+            if job.done is not None:
+                job.done.set()
+
+    def flush(self):
+        """Block until all queued writes (and buffered sensor rollups) are committed"""
+        self.flush_sensor_rollups()
+        if self.write_behind and self._writer_thread is not None:
+            self._write(lambda cur: None, wait=True)
+
     def init_tables(self):
         """Create tables if not present and write startup log"""
         start = t.time()
+        version = self.cur.execute("PRAGMA user_version;").fetchone()["user_version"]
+        if version < SCHEMA_VERSION:
+            # Alles DDL in einer Transaktion -> ein fsync statt einem pro Tabelle
+            self.cur.execute("BEGIN;")
+            self._create_schema()
+            self._migrate()
+            self.cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION};")
+        time_to_build = t.time() - start
+        # Startup-Log, damit wir grob sehen ob die DB fix fertig ist
+        self.cur.execute("""
+            INSERT INTO logs (type, code, message, deviceID)
+            VALUES (?, ?, ?, NULL);
+        """, ('info', 'startup', f'System initialized in {time_to_build:.2f} secs'))
+        self.connection.commit()
+
+    def _create_schema(self):
+        """All CREATE statements (idempotent)"""
         self.cur.execute("""
             CREATE TABLE IF NOT EXISTS logs (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -58,9 +428,29 @@ class DBWrapper:
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
                 deviceID INTEGER,
                 state INTEGER,
+                roomID INTEGER,
                 FOREIGN KEY(deviceID) REFERENCES device(id)
             );
         """)
+        if "roomID" not in self._columns("history"):
+            # Ältere DB: Raum pro Eintrag nachtragen (mehr als der aktuelle Raum ist nicht bekannt).
+            # Muss vor den Zähler-Triggern passieren; die alten Trigger lasen den aktuellen Raum
+            # des Geräts -> Trigger und Zähler werden unten neu angelegt
+            self.cur.execute("ALTER TABLE history ADD COLUMN roomID INTEGER;")
+            self.cur.execute("""
+                UPDATE history SET roomID = (SELECT roomID FROM device WHERE device.id = history.deviceID);
+            """)
+            self.cur.execute("DROP TRIGGER IF EXISTS trg_history_counters_insert;")
+            self.cur.execute("DROP TRIGGER IF EXISTS trg_history_counters_delete;")
+            self.cur.execute("DROP TABLE IF EXISTS history_counters;")
+
+        # Indizes für Zeitfenster und Geräte-Filter auf der History
+        self.cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history (timestamp);
+        """)
+        self.cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_history_device_ts ON history (deviceID, timestamp);
+        """)
 
         self.cur.execute("""
             CREATE TABLE IF NOT EXISTS device_type (
@@ -73,10 +463,11 @@ class DBWrapper:
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 devicename TEXT NOT NULL,
                 pin INTEGER NOT NULL UNIQUE,
-                second_pin INTEGER UNIQUE,
+                secondary_pin INTEGER UNIQUE,
                 device_type_id INTEGER NOT NULL,
                 roomID INTEGER,
                 state INTEGER,
+                button_type INTEGER,
                 FOREIGN KEY(device_type_id) REFERENCES device_type(id)
             );
         """)
@@ -93,101 +484,207 @@ class DBWrapper:
             );
         """)
 
+        # Schneller Zugriff auf Zeitfenster pro Sensor
+        self.cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sensor_readings_type_ts
+            ON sensor_readings (sensor_type, timestamp);
+        """)
+        # Retention löscht nach Zeit über alle Sensoren/Logs: ohne Index wäre jeder Batch ein
+        # Scan + Sortierung im Writer-Job
+        self.cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sensor_readings_timestamp ON sensor_readings (timestamp);
+        """)
+        self.cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp);
+        """)
+
+        # Rollup-Tabellen (min/max/sum pro Feld, avg = sum / samples)
+        field_columns = ",\n".join(
+            f"{field}_min REAL, {field}_max REAL, {field}_sum REAL" for field in SENSOR_FIELDS
+        )
+        for name, bucket_sec in SENSOR_ROLLUPS:
+            self.cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS sensor_rollup_{name} (
+                    sensor_type TEXT NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    samples INTEGER NOT NULL,
+                    {field_columns},
+                    PRIMARY KEY (sensor_type, bucket)
+                ) WITHOUT ROWID;
+            """)
+            self._backfill_sensor_rollup(name, bucket_sec)
+
+        # Zähler für /stats: per Trigger bei jedem INSERT/DELETE auf history gepflegt -> Lesen O(1)
+        self.cur.execute("""
+            CREATE TABLE IF NOT EXISTS history_counters (
+                scope TEXT NOT NULL,
+                key NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (scope, key)
+            ) WITHOUT ROWID;
+        """)
+        self._create_history_counter_triggers()
+        self._backfill_history_counters()
+
+        # Änderungszähler pro Datenart (ETag/304): in der DB, damit alle Prozesse dieselbe Version sehen
+        self.cur.execute("""
+            CREATE TABLE IF NOT EXISTS change_counters (
+                kind TEXT PRIMARY KEY,
+                n INTEGER NOT NULL DEFAULT 0,
+                changed_at REAL NOT NULL
+            );
+        """)
+        self.cur.executemany("""
+            INSERT OR IGNORE INTO change_counters (kind, n, changed_at) VALUES (?, 0, ?);
+        """, [(kind, t.time()) for kind in DATA_KINDS])
+
+        # Nutzung pro Gerät: Ein-Sekunden und Schaltvorgänge pro Stunde/Tag,
+        # fortgeschrieben beim Schreiben der history (device_usage_state = letzter Übergang)
+        for name, _ in USAGE_BUCKETS:
+            self.cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS device_usage_{name} (
+                    device_id INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    on_seconds REAL NOT NULL DEFAULT 0,
+                    switch_count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (device_id, bucket)
+                ) WITHOUT ROWID;
+            """)
+        self.cur.execute("""
+            CREATE TABLE IF NOT EXISTS device_usage_state (
+                device_id INTEGER PRIMARY KEY,
+                state INTEGER NOT NULL,
+                since INTEGER NOT NULL
+            );
+        """)
+        if not self.cur.execute("SELECT 1 FROM device_usage_state LIMIT 1;").fetchone():
+            self._rebuild_device_usage(self.cur)  # bestehende history einmalig auswerten
+
         # Default device types (fixed ids): 1=output, 2=input, 3=virt, 4=sensor
         self.cur.executemany("""
             INSERT OR IGNORE INTO device_type (id, device_type) VALUES (?, ?);
         """, [(1, 'output'), (2, 'input'), (3, 'virtual_input'), (4, 'sensor')])
-        time_to_build = t.time() - start
-        # Startup-Log, damit wir grob sehen ob die DB fix fertig ist
-        self.cur.execute("""
-            INSERT INTO logs (type, code, message, deviceID)
-            VALUES (?, ?, ?, NULL);
-        """, ('info', 'startup', f'System initialized in {time_to_build:.2f} secs'))
-        self.connection.commit()
+
+    def _create_history_counter_triggers(self):
+        """Triggers that keep history_counters equal to COUNT(*) of history"""
+        insert_counts = "\n".join(f"""
+                INSERT INTO history_counters (scope, key, count) VALUES ('{scope}', {key.format(row="NEW")}, 1)
+                ON CONFLICT (scope, key) DO UPDATE SET count = count + 1;""" for scope, key in HISTORY_COUNTER_SCOPES.items())
+        # Retention löscht alte history -> Zähler bleiben gleich COUNT(*) der Tabelle
+        delete_counts = "\n".join(f"""
+                UPDATE history_counters SET count = count - 1
+                WHERE scope = '{scope}' AND key = {key.format(row="OLD")};""" for scope, key in HISTORY_COUNTER_SCOPES.items())
+        self.cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_history_counters_insert AFTER INSERT ON history
+            BEGIN {insert_counts}
+            END;
+        """)
+        self.cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_history_counters_delete AFTER DELETE ON history
+            BEGIN {delete_counts}
+            END;
+        """)
+
+    def _columns(self, table: str):
+        return {row["name"] for row in self.cur.execute(f"PRAGMA table_info({table});").fetchall()}
+
+    def _migrate(self):
+        """Bring tables of older databases up to the current columns"""
+        columns = self._columns("device")
+        if "second_pin" in columns and "secondary_pin" not in columns:
+            # Alte CREATE-Anweisung hatte second_pin, add_device schreibt secondary_pin
+            self.cur.execute("ALTER TABLE device RENAME COLUMN second_pin TO secondary_pin;")
+        if "button_type" not in columns:
+            # 1 = Switch, 2 = Press; nötig um Buttons nach einem Neustart wiederherzustellen
+            self.cur.execute("ALTER TABLE device ADD COLUMN button_type INTEGER;")
 
     def init_db(self):
         """Convenience: create connection"""
         self.create_db()
         return self.cur
 
+    def _insert_log(self, cur, msg_type: str, code: str, message: str, device_id=None, timestamp=None):
+        cur.execute("""
+            INSERT INTO logs (timestamp, type, code, message, deviceID)
+            VALUES (?, ?, ?, ?, ?);
+        """, (timestamp or _utc_now(), msg_type, code, message, device_id))
+
     def write_log(self, msg_type: str, code: str, message: str, device_id=None):
         """Write log entry"""
-        self.cur.execute("""
-            INSERT INTO logs (type, code, message, deviceID)
-            VALUES (?, ?, ?, ?);
-        """, (msg_type, code, message, device_id))
-        self.connection.commit()
+        timestamp = _utc_now()  # Zeitpunkt beim Aufruf, nicht beim Commit
+        self._write(lambda cur: self._insert_log(cur, msg_type, code, message, device_id, timestamp))
 
-    def add_device(self, device_name: str, pin: int, device_type: int, secondary_pin=None, room_id = 0):
+    def add_device(self, device_name: str, pin: int, device_type: int, secondary_pin=None, room_id = 0, button_type=None):
         """Add new device (unique pin). Returns True/False"""
-        device_type_obj = self.cur.execute("""
+        device_type_obj = self._query_one("""
             SELECT id FROM device_type WHERE id = ?;
-        """, (device_type,)).fetchone()
+        """, (device_type,))
         if not device_type_obj:
             raise DeviceTypeNotFoundException(f"Device type not found", device_type)
             
-        try:
+        def insert_device(cur):
             if device_type == 1:
                 # Output: nur ein Pin
-                self.cur.execute("""
+                cur.execute("""
                     INSERT INTO device (devicename, pin, device_type_id, roomID)
                     VALUES (?, ?, ?, ?);
                 """, (device_name, pin, device_type, room_id))
             elif device_type == 2:
                 # Input/Button: hat zusätzlich einen Secondary-Pin
-                self.cur.execute("""
-                    INSERT INTO device (devicename, pin, secondary_pin, device_type_id, roomID)
-                    VALUES (?, ?, ?, ?, ?);
-                """, (device_name, pin, secondary_pin, device_type, room_id))
+                cur.execute("""
+                    INSERT INTO device (devicename, pin, secondary_pin, device_type_id, roomID, button_type)
+                    VALUES (?, ?, ?, ?, ?, ?);
+                """, (device_name, pin, secondary_pin, device_type, room_id, button_type))
+            self._insert_log(cur, "info", "device_added", f"Successfully added device {device_name} of type {device_type} on pin {pin}")
+
+        try:
+            self._write(insert_device, wait=True, touches=("device",))  # Ergebnis wird gebraucht -> warten
         except sqlite3.IntegrityError:
             return False
-        self.write_log("info", "device_added", f"Successfully added device {device_name} of type {device_type} on pin {pin}")
-        self.connection.commit()
         return True
 
     def remove_device(self, pin):
         """Remove device by pin or raise exception"""
-        pin_is_in_use = self.cur.execute("""
-            SELECT pin FROM device WHERE pin = ?;
-        """, (pin,)).fetchone()
-        if pin_is_in_use:
+        def delete_device(cur):
             # Gerät entfernen, Pin wird wieder frei
-            self.cur.execute("""
+            removed = cur.execute("""
                 DELETE FROM device WHERE pin = ?;
-            """, (pin,))
-            self.write_log("info", "device_removed", f"Successfully removed device on pin {pin}")
-            self.connection.commit()
-        else:
-            raise DeviceNotFoundException(f"Device with pin {pin} not found")
+            """, (pin,)).rowcount
+            if removed:
+                self._insert_log(cur, "info", "device_removed", f"Successfully removed device on pin {pin}")
+            return removed
+
+        if not self._write(delete_device, wait=True, touches=("device",)):
+            raise DeviceNotFoundException(f"Device with pin {pin} not found", pin)
 
     def get_device(self, pin):
         """Get device by pin (or None)"""
-        device = self.cur.execute("""
+        device = self._query_one("""
         SELECT * FROM device WHERE pin = ?;
-        """, (pin,)).fetchone()
+        """, (pin,))
         
         return device
     
     def get_all_devices(self):
         """All devices (list)"""
-        all_devices = self.cur.execute("""
+        all_devices = self._query("""
         SELECT * FROM device ORDER BY roomID DESC;
-        """).fetchall()
+        """)
         return all_devices
     
     def get_all_devices_for_room(self,room_id: int):
         """Devices in room"""
-        all_devices_for_room = self.cur.execute("""
+        all_devices_for_room = self._query("""
         SELECT * FROM device WHERE roomID = ?;
-        """, (room_id,)).fetchall()
+        """, (room_id,))
 
         return all_devices_for_room
     
     def get_all_devices_grouped_by_room(self):
         """Devices grouped by room -> dict"""
-        all_devices = self.cur.execute("""
+        all_devices = self._query("""
         SELECT * FROM device ORDER BY roomID DESC;
-        """).fetchall()
+        """)
 
         grouped_devices = {}
 
@@ -202,83 +699,402 @@ class DBWrapper:
 
     def update_device_state_by_pin(self, pin: int, state: int):
         """Persist current state"""
-        update = self.cur.execute("""
-        UPDATE device SET state = ? WHERE pin = ?;
-        """, (state,pin, ))
-        self.write_log("INFO", 200 , f"Updated state on pin {pin} to {state}")
-        self.connection.commit()
+        timestamp = _utc_now()
+
+        def update_state(cur):
+            cur.execute("""
+            UPDATE device SET state = ? WHERE pin = ?;
+            """, (state,pin, ))
+            self._insert_log(cur, "INFO", 200 , f"Updated state on pin {pin} to {state}", timestamp=timestamp)
+
+        self._write(update_state, touches=("device",))
+
+    def apply_device_states(self, changes):
+        """Persist several state changes (device_id, pin, state[, unix_ts]) in one transaction"""
+        if not changes:
+            return
+        now = int(t.time())
+        # Optionaler 4. Wert: Zeitpunkt des Ereignisses (z.B. Tastendruck), sonst jetzt
+        rows = [(device_id, pin, state, int(rest[0]) if rest else now) for device_id, pin, state, *rest in changes]
+
+        def apply_states(cur):
+            cur.executemany("""
+            UPDATE device SET state = ? WHERE pin = ?;
+            """, [(state, pin) for device_id, pin, state, timestamp in rows])
+            cur.executemany("""
+            INSERT INTO logs (timestamp, type, code, message, deviceID)
+            VALUES (?, 'INFO', 200, ?, ?);
+            """, [(_utc_now(ts), f"Updated state on pin {pin} to {state}", device_id) for device_id, pin, state, ts in rows])
+            cur.executemany("""
+            INSERT INTO history (timestamp, deviceID, state, roomID)
+            VALUES (?, ?, ?, (SELECT roomID FROM device WHERE id = ?));
+            """, [(_utc_now(ts), device_id, state, device_id) for device_id, pin, state, ts in rows])
+            self._record_usage(cur, [(device_id, state, ts) for device_id, pin, state, ts in rows])
+
+        # Warten, damit der Aufrufer bei einem Fehler die Hardware zurücksetzen kann
+        self._write(apply_states, wait=True, touches=("device", "history"))
+
+    def prune_table(self, table: str, older_than: int, batch_size: int = 500, fetch_rows: bool = False):
+        """Delete up to batch_size rows older than a unix timestamp -> deleted rows (or count)"""
+        if table not in RETENTION_TABLES:
+            raise ValueError(f"No retention for table {table}")
+        column, is_epoch = RETENTION_TABLES[table]
+        cutoff = "?" if is_epoch else "datetime(?, 'unixepoch')"
+        if table.startswith("sensor_rollup_"):
+            key = "(sensor_type, bucket)"  # WITHOUT ROWID -> Primärschlüssel
+            select_key = "sensor_type, bucket"
+        else:
+            key = select_key = "id"
+
+        def prune(cur):
+            rows = []
+            if fetch_rows:
+                rows = cur.execute(f"""
+                    SELECT * FROM {table} WHERE {column} < {cutoff} ORDER BY {column} LIMIT ?;
+                """, (int(older_than), batch_size)).fetchall()
+            deleted = cur.execute(f"""
+                DELETE FROM {table} WHERE {key} IN (
+                    SELECT {select_key} FROM {table} WHERE {column} < {cutoff} ORDER BY {column} LIMIT ?
+                );
+            """, (int(older_than), batch_size)).rowcount
+            return rows if fetch_rows else deleted
+
+        # kleine Batches, jeder ein eigener kurzer Job -> andere Writes kommen dazwischen dran
+        touches = ("history",) if table == "history" else (("sensor",) if table.startswith("sensor_") else ())
+        return self._write(prune, wait=True, touches=touches)
+
+    def ensure_incremental_vacuum(self):
+        """Switch an existing DB to auto_vacuum=INCREMENTAL (one-time VACUUM) -> True if converted"""
+        def convert(cur):
+            # Auf der Schreib-Verbindung prüfen: Leser aus dem Pool melden nach dem VACUUM
+            # noch den alten Modus (gecacht) -> sonst würde jedes Mal neu konvertiert
+            if cur.execute("PRAGMA auto_vacuum;").fetchone()["auto_vacuum"] == 2:
+                return False
+            cur.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+            cur.execute("VACUUM;")
+            return True
+
+        return self._write(convert, raw=True)
+
+    def incremental_vacuum(self, pages: int = 200):
+        """Give up to `pages` free pages back to the file system"""
+        self._write(lambda cur: cur.execute(f"PRAGMA incremental_vacuum({int(pages)});").fetchall(), raw=True)
+
+    def get_freelist_count(self):
+        """Number of unused pages in the DB file"""
+        return self._query_one("PRAGMA freelist_count;")["freelist_count"]
 
     def get_number_of_rooms(self):
         """List distinct roomIDs"""
-        result = self.cur.execute("""
+        result = self._query("""
         SELECT DISTINCT roomID FROM device;
-        """).fetchall()
+        """)
         return result
     
     def create_record(self, deviceID, state):
         """Create history record"""
-        self.cur.execute("""
-            INSERT INTO history (deviceID, state) VALUES (?, ?)
-        """, (deviceID, state, ))
+        ts = int(t.time())
 
-        self.connection.commit()
+        def insert_record(cur):
+            # Raum mit speichern: Zähler pro Raum bleiben stimmig, auch wenn das Gerät später umzieht
+            cur.execute("""
+                INSERT INTO history (timestamp, deviceID, state, roomID)
+                VALUES (?, ?, ?, (SELECT roomID FROM device WHERE id = ?))
+            """, (_utc_now(ts), deviceID, state, deviceID))
+            self._record_usage(cur, [(deviceID, state, ts)])
+
+        self._write(insert_record, touches=("history",))
         return True
     
     def get_num_state_updates(self):
-        """Number of state changes (COUNT)"""
-        row = self.cur.execute("""
-            SELECT COUNT(deviceID) AS cnt FROM history;
-        """).fetchone()
+        """Number of state changes (counter maintained by trigger)"""
+        row = self._query_one("""
+            SELECT COALESCE(SUM(count), 0) AS cnt FROM history_counters WHERE scope = 'total';
+        """)
         return int(row.get('cnt', 0) if isinstance(row, dict) else row[0])
-    def get_history(self):
-        """History grouped by minute"""
-        history_entries = self.cur.execute("""
-            SELECT 
+    def get_history(self, limit: int = 200):
+        """History grouped by minute (newest page only)"""
+        return self.get_history_page(limit)["history"]
+
+    def get_history_page(self, limit: int = 200, before_id=None, ts_from=None, ts_to=None):
+        """One page of history (newest first), grouped by minute + cursor for the next page"""
+        conditions = []
+        params = []
+        if before_id is not None:
+            conditions.append("history.id < ?")  # Keyset-Cursor statt OFFSET
+            params.append(int(before_id))
+        if ts_from is not None:
+            conditions.append("history.timestamp >= datetime(?, 'unixepoch')")
+            params.append(int(ts_from))
+        if ts_to is not None:
+            conditions.append("history.timestamp <= datetime(?, 'unixepoch')")
+            params.append(int(ts_to))
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+        limit = max(1, int(limit))  # LIMIT -1 hieße in SQLite "alles"
+        rows = self._query(f"""
+            SELECT
+                history.id,
                 strftime('%Y-%m-%d %H:%M', history.timestamp) AS minute_group,
                 device.devicename,
                 device.id AS device_id,
                 device.roomID,
                 history.state
-            FROM 
+            FROM
                 history
-            JOIN 
+            JOIN
                 device ON history.deviceID = device.id
-            GROUP BY 
-                minute_group, device.id
-            ORDER BY 
-                minute_group DESC;
-        """)
-        grouped_data = self.group_by_minute(history_entries)
-        return grouped_data
+            {where}
+            ORDER BY
+                history.id DESC
+            LIMIT ?;
+        """, (*params, limit))
+
+        # Pro Minute und Gerät nur den letzten Zustand anzeigen (wie früher das GROUP BY)
+        seen = set()
+        latest_rows = []
+        for row in rows:
+            key = (row["minute_group"], row["device_id"])
+            if key not in seen:
+                seen.add(key)
+                latest_rows.append(row)
+        next_cursor = rows[-1]["id"] if rows and len(rows) == limit else None
+        return {"history": self.group_by_minute(latest_rows), "next_cursor": next_cursor}
 
     def get_all_buttons(self):
         """All button devices (device_type_id=2)"""
-        return  self.cur.execute("""
+        return  self._query("""
             SELECT * FROM device WHERE device_type_id=2;
-        """).fetchall()
+        """)
         
 
-    def insert_sensor_reading(self, sensor_type: str, reading: dict):
-        # Rohwerte vom Sensor in die DB schreiben
-        self.cur.execute(
-            """
-            INSERT INTO sensor_readings (
-                sensor_type, temperature_c, humidity, pressure_hpa, gas_ohms
-            ) VALUES (?, ?, ?, ?, ?);
-            """,
-            (
+    def _backfill_history_counters(self):
+        """Fill empty history_counters from the existing history (one-time)"""
+        has_rows = self.cur.execute("""
+            SELECT 1 FROM history_counters LIMIT 1;
+        """).fetchone()
+        if has_rows:
+            return
+        for scope, key in HISTORY_COUNTER_SCOPES.items():
+            self.cur.execute(f"""
+                INSERT INTO history_counters (scope, key, count)
+                SELECT '{scope}', {key.format(row="history")} AS counter_key, COUNT(*)
+                FROM history
+                GROUP BY counter_key;
+            """)
+
+    def get_history_counters(self, days: int = 30):
+        """Counters of history entries: total, per device, per room and per day (last N days)"""
+        rows = self._query("""
+            SELECT scope, key, count FROM history_counters
+            WHERE scope IN ('total', 'device', 'room') AND count > 0;
+        """)
+        day_rows = self._query("""
+            SELECT key AS day, count FROM history_counters
+            WHERE scope = 'day' AND key >= date('now', ?) AND count > 0
+            ORDER BY key;
+        """, (f"-{int(days)} days",))
+        names = {device["id"]: device["devicename"] for device in self.get_all_devices()}
+        result = {"total": 0, "devices": [], "rooms": [], "days": day_rows}
+        for row in rows:
+            if row["scope"] == "total":
+                result["total"] = row["count"]
+            elif row["scope"] == "device":
+                result["devices"].append({"device_id": row["key"], "devicename": names.get(row["key"]), "count": row["count"]})
+            else:
+                result["rooms"].append({"room_id": row["key"], "count": row["count"]})
+        return result
+
+    def _record_usage(self, cur, transitions):
+        """Add state transitions [(device_id, state, unix_ts)] to the usage summaries (inside a write job)"""
+        device_ids = list({int(device_id) for device_id, _, _ in transitions})
+        placeholders = ",".join("?" * len(device_ids))
+        last = {
+            row["device_id"]: (row["state"], row["since"]) for row in cur.execute(f"""
+                SELECT device_id, state, since FROM device_usage_state WHERE device_id IN ({placeholders});
+            """, device_ids).fetchall()
+        }
+        accumulator = _UsageAccumulator(last)
+        for device_id, state, ts in transitions:
+            accumulator.add(int(device_id), state, int(ts))
+        accumulator.write(cur)
+
+    def _rebuild_device_usage(self, cur):
+        """Recompute the usage summaries from the whole history"""
+        for name, _ in USAGE_BUCKETS:
+            cur.execute(f"DELETE FROM device_usage_{name};")
+        cur.execute("DELETE FROM device_usage_state;")
+        accumulator = _UsageAccumulator()
+        rows = cur.execute("""
+            SELECT deviceID AS device_id, state, CAST(strftime('%s', timestamp) AS INTEGER) AS ts
+            FROM history
+            WHERE deviceID IS NOT NULL AND timestamp IS NOT NULL
+            ORDER BY timestamp, id;
+        """)
+        while True:
+            chunk = rows.fetchmany(5000)  # Cursor in Stücken lesen, Summen bleiben klein im Speicher
+            if not chunk:
+                break
+            for row in chunk:
+                accumulator.add(int(row["device_id"]), row["state"], row["ts"])
+        accumulator.write(cur)
+        return len(accumulator.last)
+
+    def rebuild_device_usage(self):
+        """Backfill job: rebuild the usage summaries from history -> number of devices"""
+        return self._write(self._rebuild_device_usage, wait=True, touches=("history",))
+
+    def get_device_usage(self, resolution: str = "day", ts_from=None, ts_to=None, device_id=None):
+        """On-time, switch count and duty cycle per device and bucket (open on-interval counted up to now)"""
+        bucket_sec = dict(USAGE_BUCKETS).get(resolution)
+        if bucket_sec is None:
+            raise ValueError(f"Unknown resolution {resolution}")
+        now = int(t.time())
+        ts_to = now if ts_to is None else min(int(ts_to), now)
+        ts_from = ts_to - (7 if resolution == "day" else 1) * 86400 if ts_from is None else int(ts_from)
+        ts_from -= ts_from % bucket_sec  # auf Bucket-Grenze
+        params = [ts_from, ts_to]
+        device_filter = ""
+        if device_id is not None:
+            device_filter = "AND device_id = ?"
+            params.append(int(device_id))
+        usage = {}
+        for row in self._query(f"""
+            SELECT device_id, bucket, on_seconds, switch_count FROM device_usage_{resolution}
+            WHERE bucket >= ? AND bucket <= ? {device_filter}
+            ORDER BY bucket;
+        """, tuple(params)):
+            usage[(row["device_id"], row["bucket"])] = [row["on_seconds"], row["switch_count"]]
+
+        # Noch eingeschaltete Geräte: Zeit seit dem letzten Übergang ist noch nicht verbucht
+        for row in self._query(f"""
+            SELECT device_id, since FROM device_usage_state WHERE state = 1 AND since < ? {device_filter};
+        """, tuple([now] + params[2:])):
+            for bucket, seconds in _split_interval(max(row["since"], ts_from), now, bucket_sec):
+                if bucket <= ts_to:
+                    usage.setdefault((row["device_id"], bucket), [0.0, 0])[0] += seconds
+
+        names = {device["id"]: device["devicename"] for device in self.get_all_devices()}
+        devices = {}
+        for (dev_id, bucket), (on_seconds, switches) in sorted(usage.items(), key=lambda item: item[0][1]):
+            # Laufender Bucket zählt nur bis jetzt
+            elapsed = min(bucket + bucket_sec, now) - bucket
+            entry = devices.setdefault(dev_id, {
+                "device_id": dev_id, "devicename": names.get(dev_id),
+                "on_seconds": 0.0, "switch_count": 0, "elapsed": 0, "buckets": [],
+            })
+            entry["buckets"].append({
+                "bucket": bucket,
+                "on_seconds": round(on_seconds, 1),
+                "switch_count": switches,
+                "duty_cycle": round(min(on_seconds / elapsed, 1.0), 4) if elapsed > 0 else None,
+            })
+            entry["on_seconds"] += on_seconds
+            entry["switch_count"] += switches
+        span = max(ts_to - ts_from, 1)
+        for entry in devices.values():
+            entry["duty_cycle"] = round(min(entry["on_seconds"] / span, 1.0), 4)
+            entry["on_seconds"] = round(entry["on_seconds"], 1)
+            del entry["elapsed"]
+        return {
+            "resolution": resolution, "from": ts_from, "to": ts_to,
+            "devices": sorted(devices.values(), key=lambda entry: -entry["on_seconds"]),
+        }
+
+    def _backfill_sensor_rollup(self, name: str, bucket_sec: int):
+        """Fill an empty rollup tier from sensor_readings (one-time)"""
+        has_rows = self.cur.execute(f"""
+            SELECT 1 FROM sensor_rollup_{name} LIMIT 1;
+        """).fetchone()
+        if has_rows:
+            return
+        aggregates = ", ".join(
+            f"MIN({field}), MAX({field}), SUM({field})" for field in SENSOR_FIELDS
+        )
+        self.cur.execute(f"""
+            INSERT INTO sensor_rollup_{name}
+            SELECT
                 sensor_type,
-                reading.get("temperature_c"),
-                reading.get("humidity"),
-                reading.get("pressure_hpa"),
-                reading.get("gas_ohms"),
-            ),
+                (CAST(strftime('%s', timestamp) AS INTEGER) / {bucket_sec}) * {bucket_sec} AS bucket,
+                COUNT(*),
+                {aggregates}
+            FROM sensor_readings
+            GROUP BY sensor_type, bucket;
+        """)
+
+    def _upsert_sensor_rollups(self, cur, rows):
+        """Merge aggregated rows (name, sensor_type, bucket, samples, [min, max, sum per field]) into the rollups"""
+        columns = ", ".join(
+            f"{field}_min, {field}_max, {field}_sum" for field in SENSOR_FIELDS
         )
-        self.connection.commit()
+        placeholders = ", ".join("?, ?, ?" for _ in SENSOR_FIELDS)
+        # min/max ignorieren NULL-Werte, sonst würde ein fehlender Wert alles "nullen"
+        updates = ",\n".join(
+            f"""{field}_min = CASE WHEN excluded.{field}_min IS NULL THEN {field}_min
+                    WHEN {field}_min IS NULL THEN excluded.{field}_min
+                    ELSE MIN({field}_min, excluded.{field}_min) END,
+                {field}_max = CASE WHEN excluded.{field}_max IS NULL THEN {field}_max
+                    WHEN {field}_max IS NULL THEN excluded.{field}_max
+                    ELSE MAX({field}_max, excluded.{field}_max) END,
+                {field}_sum = CASE WHEN excluded.{field}_sum IS NULL THEN {field}_sum
+                    ELSE COALESCE({field}_sum, 0) + excluded.{field}_sum END"""
+            for field in SENSOR_FIELDS
+        )
+        for name, _ in SENSOR_ROLLUPS:
+            cur.executemany(f"""
+                INSERT INTO sensor_rollup_{name} (sensor_type, bucket, samples, {columns})
+                VALUES (?, ?, ?, {placeholders})
+                ON CONFLICT (sensor_type, bucket) DO UPDATE SET
+                    samples = samples + excluded.samples,
+                    {updates};
+            """, [(sensor_type, bucket, samples, *values)
+                  for tier, sensor_type, bucket, samples, values in rows if tier == name])
+
+    def insert_sensor_reading(self, sensor_type: str, reading: dict, store_raw=None):
+        # Rohwerte vom Sensor in die DB schreiben (+ Rollups mitziehen)
+        self.insert_sensor_readings([(sensor_type, reading)], store_raw)
+
+    def insert_sensor_readings(self, samples, store_raw=None):
+        """Store several (sensor_type, reading) samples.
+        Every sample goes into the rollups (buffered in memory); store_raw(sensor_type, reading)
+        decides about the raw row. Without a raw row or a closed minute nothing is written."""
+        raw_rows = []
+        closed = False
+        with self._rollup_lock:
+            for sensor_type, reading in samples:
+                ts = int(reading.get("timestamp") or t.time())
+                # Rollups sollen zeitlich gewichtet sein -> dort jeder Wert, Rohtabelle nur gefiltert
+                closed = self._rollups.add(sensor_type, ts, reading) or closed
+                if store_raw is None or store_raw(sensor_type, reading):
+                    raw_rows.append((ts, sensor_type, reading))
+            if not raw_rows and not closed:
+                return  # gefilterter Wert in der laufenden Minute -> kein Commit
+            rollup_rows = self._rollups.take()
+
+        def insert_readings(cur):
+            cur.executemany(
+                """
+                INSERT INTO sensor_readings (
+                    timestamp, sensor_type, temperature_c, humidity, pressure_hpa, gas_ohms
+                ) VALUES (datetime(?, 'unixepoch'), ?, ?, ?, ?, ?);
+                """,
+                [(ts, sensor_type, *(reading.get(field) for field in SENSOR_FIELDS)) for ts, sensor_type, reading in raw_rows],
+            )
+            self._upsert_sensor_rollups(cur, rollup_rows)
+
+        self._write(insert_readings, touches=("sensor",))
+
+    def flush_sensor_rollups(self):
+        """Write the buffered rollup aggregates now (shutdown, tests)"""
+        if self.connection is None:
+            return  # schon geschlossen
+        with self._rollup_lock:
+            rollup_rows = self._rollups.take()
+        if rollup_rows:
+            self._write(lambda cur: self._upsert_sensor_rollups(cur, rollup_rows), wait=True, touches=("sensor",))
 
     def get_latest_sensor_reading(self, sensor_type: str = 'bme680'):
         # Letzten Eintrag holen (timestamp + id, damit es stabil ist)
-        return self.cur.execute(
+        return self._query_one(
             """
             SELECT * FROM sensor_readings
             WHERE sensor_type = ?
@@ -286,11 +1102,148 @@ class DBWrapper:
             LIMIT 1;
             """,
             (sensor_type,),
-        ).fetchone()
+        )
+
+    def get_sensor_history(self, sensor_type: str = 'bme680', limit: int = 300,
+                           ts_from=None, ts_to=None, resolution=None, raw_interval: int = 10):
+        """Sensor history (oldest first); raw rows or a rollup tier for a time range"""
+        if ts_from is None and ts_to is None and resolution in (None, "raw"):
+            return self._get_latest_raw_sensor_rows(sensor_type, limit)
 
-    def get_sensor_history(self, sensor_type: str = 'bme680', limit: int = 300):
+        ts_to = int(ts_to) if ts_to is not None else int(t.time())
+        if ts_from is None:
+            # Ohne Startzeit: die letzten "limit" Punkte der gewählten Stufe
+            bucket_sec = dict(SENSOR_ROLLUPS).get(resolution, raw_interval)
+            ts_from = ts_to - limit * bucket_sec
+        ts_from = int(ts_from)
+        if resolution in (None, "auto"):
+            resolution = self.pick_sensor_resolution(ts_to - ts_from, limit, raw_interval)
+
+        if resolution == "raw":
+            rows = self._query(
+                """
+                SELECT
+                    CAST(strftime('%s', timestamp) AS INTEGER) AS ts,
+                    temperature_c, humidity, pressure_hpa, gas_ohms
+                FROM sensor_readings
+                WHERE sensor_type = ?
+                  AND timestamp BETWEEN datetime(?, 'unixepoch') AND datetime(?, 'unixepoch')
+                ORDER BY timestamp DESC, id DESC
+                LIMIT ?;
+                """,
+                (sensor_type, ts_from, ts_to, limit),
+            )
+            if len(rows) < limit and (not rows or rows[-1]["ts"] > ts_from):
+                # Deadband: Wert vor dem Fenster gilt weiter -> als Startpunkt bei ts_from
+                previous = self._query_one(
+                    """
+                    SELECT temperature_c, humidity, pressure_hpa, gas_ohms
+                    FROM sensor_readings
+                    WHERE sensor_type = ? AND timestamp < datetime(?, 'unixepoch')
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT 1;
+                    """,
+                    (sensor_type, ts_from),
+                )
+                if previous:
+                    rows.append(dict(previous, ts=ts_from))
+            return list(reversed(rows))
+
+        if resolution not in dict(SENSOR_ROLLUPS):
+            raise ValueError(f"Unknown resolution {resolution}")
+        bucket_sec = dict(SENSOR_ROLLUPS)[resolution]
+        ts_from -= ts_from % bucket_sec  # angebrochenen ersten Bucket mitnehmen
+        # avg aus sum/samples, min/max direkt aus der Rollup-Zeile
+        columns = ",\n".join(
+            f"{field}_sum / samples AS {field}, {field}_min, {field}_max" for field in SENSOR_FIELDS
+        )
+        rows = self._query(
+            f"""
+            SELECT bucket AS ts, samples, {columns}
+            FROM sensor_rollup_{resolution}
+            WHERE sensor_type = ? AND bucket BETWEEN ? AND ?
+            ORDER BY bucket DESC
+            LIMIT ?;
+            """,
+            (sensor_type, ts_from, ts_to, limit),
+        )
+        if len(rows) < limit and (not rows or rows[-1]["ts"] > ts_from):
+            # Letzten Bucket vor dem Fenster fortschreiben (samples = 0: keine eigenen Messwerte)
+            previous = self._query_one(
+                f"""
+                SELECT {columns}
+                FROM sensor_rollup_{resolution}
+                WHERE sensor_type = ? AND bucket < ?
+                ORDER BY bucket DESC
+                LIMIT 1;
+                """,
+                (sensor_type, ts_from),
+            )
+            if previous:
+                rows.append(dict(previous, ts=ts_from, samples=0))
+        return list(reversed(rows))
+
+    def sensor_export_columns(self, resolution: str = "raw"):
+        """Column names of an export at this resolution (ts first)"""
+        if resolution == "raw":
+            return ["ts", *SENSOR_FIELDS]
+        if resolution not in dict(SENSOR_ROLLUPS):
+            raise ValueError(f"Unknown resolution {resolution}")
+        return ["ts", "samples"] + [f"{field}{suffix}" for field in SENSOR_FIELDS for suffix in ("", "_min", "_max")]
+
+    @contextmanager
+    def sensor_export(self, sensor_type: str, ts_from: int, ts_to: int, resolution: str = "raw"):
+        """Read snapshot for streamed exports -> chunks(columns=None, chunk_size=500) generator function"""
+        all_columns = self.sensor_export_columns(resolution)
+        if resolution == "raw":
+            expressions = {"ts": "CAST(strftime('%s', timestamp) AS INTEGER)"}
+            expressions.update({field: field for field in SENSOR_FIELDS})
+            source = """FROM sensor_readings WHERE sensor_type = ?
+                        AND timestamp BETWEEN datetime(?, 'unixepoch') AND datetime(?, 'unixepoch')
+                        ORDER BY timestamp, id"""
+            previous = """FROM sensor_readings WHERE sensor_type = ? AND timestamp < datetime(?, 'unixepoch')
+                          ORDER BY timestamp DESC, id DESC LIMIT 1"""
+        else:
+            ts_from -= ts_from % dict(SENSOR_ROLLUPS)[resolution]  # angebrochenen ersten Bucket mitnehmen
+            expressions = {"ts": "bucket", "samples": "samples"}
+            for field in SENSOR_FIELDS:
+                expressions[field] = f"{field}_sum / samples"
+                expressions[f"{field}_min"] = f"{field}_min"
+                expressions[f"{field}_max"] = f"{field}_max"
+            source = f"FROM sensor_rollup_{resolution} WHERE sensor_type = ? AND bucket BETWEEN ? AND ? ORDER BY bucket"
+            previous = f"FROM sensor_rollup_{resolution} WHERE sensor_type = ? AND bucket < ? ORDER BY bucket DESC LIMIT 1"
+
+        with self._reader() as cur:
+            cur.row_factory = None  # Tupel statt Dicts, spart pro Zeile ein Dict
+            if self.db_name != ":memory:":
+                # Ein Snapshot für alle Durchläufe (spaltenweise Exporte lesen mehrmals)
+                cur.execute("BEGIN;")
+
+            def chunks(columns=None, chunk_size=500):
+                columns = columns or all_columns
+                # ts immer als erste (versteckte) Spalte, für das Fortschreiben des Startwerts
+                select = ", ".join(["CAST(strftime('%s', timestamp) AS INTEGER)" if resolution == "raw" else "bucket"]
+                                   + [expressions[column] for column in columns])
+                carried = cur.execute(f"SELECT {select} {previous};", (sensor_type, ts_from)).fetchone()
+                cur.execute(f"SELECT {select} {source};", (sensor_type, ts_from, ts_to))
+                first = True
+                while True:
+                    rows = cur.fetchmany(chunk_size)
+                    if first and carried is not None and (not rows or rows[0][0] > ts_from):
+                        # Deadband: Wert vor dem Fenster gilt bei ts_from noch
+                        values = [ts_from if column == "ts" else (0 if column == "samples" else value)
+                                  for column, value in zip(columns, carried[1:])]
+                        rows = [(ts_from, *values)] + rows
+                    first = False
+                    if not rows:
+                        return
+                    yield [row[1:] for row in rows]
+
+            yield all_columns, chunks
+
+    def _get_latest_raw_sensor_rows(self, sensor_type: str, limit: int):
         # Historie für Diagramme (als Liste, jüngste Einträge zuerst)
-        rows = self.cur.execute(
+        rows = self._query(
             """
             SELECT 
                 strftime('%s', timestamp) AS ts,
@@ -301,11 +1254,23 @@ class DBWrapper:
             LIMIT ?;
             """,
             (sensor_type, limit),
-        ).fetchall()
+        )
         return list(reversed(rows))
 
 
     def close(self):
-        """Close DB connection"""
+        """Flush pending writes and close DB connection"""
+        self.flush_sensor_rollups()  # noch gepufferte Minuten nicht verlieren
+        if self._writer_thread is not None:
+            self._write_queue.put(None)  # Sentinel: Writer leert die Queue und beendet sich
+            self._writer_thread.join()
+            self._writer_thread = None
+        while True:
+            try:
+                self._read_pool.get_nowait().close()
+            except queue.Empty:
+                break
+        self._readers_created = 0
         if self.connection:
             self.connection.close()
+            self.connection = None
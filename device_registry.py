@@ -0,0 +1,186 @@
+import threading
+
+# In-Memory-Registry für Geräte, sitzt vor dem DBWrapper.
+# Einmal laden, danach kommen alle Lesezugriffe aus dem Speicher.
+# Schreibzugriffe laufen weiter über die DB und halten den Cache aktuell.
+
+
+class DeviceRegistry:
+    """Device cache indexed by pin, id, room and type"""
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._by_pin = {}
+        self._by_id = {}     # id -> pin
+        self._by_room = {}   # roomID -> set(pin)
+        self._by_type = {}   # device_type_id -> set(pin)
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    # ---------------------- intern ----------------------
+
+    def load(self):
+        """(Re)load all devices from the database"""
+        rows = self.db.get_all_devices()
+        with self._lock:
+            self._by_pin = {}
+            self._by_id = {}
+            self._by_room = {}
+            self._by_type = {}
+            for row in rows:
+                self._add_to_index(row)
+            self._loaded = True
+            self.loads += 1
+
+    def invalidate(self):
+        """Force reload on next access"""
+        with self._lock:
+            self._loaded = False
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def _add_to_index(self, row):
+        pin = row["pin"]
+        self._by_pin[pin] = row
+        self._by_id[row["id"]] = pin
+        self._by_room.setdefault(row["roomID"], set()).add(pin)
+        self._by_type.setdefault(row["device_type_id"], set()).add(pin)
+
+    def _remove_from_index(self, pin):
+        row = self._by_pin.pop(pin, None)
+        if row is None:
+            return
+        self._by_id.pop(row["id"], None)
+        self._by_room.get(row["roomID"], set()).discard(pin)
+        self._by_type.get(row["device_type_id"], set()).discard(pin)
+
+    def _rows(self, pins):
+        # Kopien rausgeben, damit Aufrufer den Cache nicht verändern
+        # Sortierung wie in der DB: roomID absteigend, dann nach id
+        rows = [self._by_pin[pin] for pin in pins]
+        rows.sort(key=lambda row: (-(row["roomID"] or 0), row["id"]))
+        return [dict(row) for row in rows]
+
+    def _lookup(self, pin):
+        row = self._by_pin.get(pin)
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(row)
+
+    # ---------------------- reads ----------------------
+
+    def get_device(self, pin):
+        """Device by pin (or None)"""
+        with self._lock:
+            self._ensure_loaded()
+            return self._lookup(pin)
+
+    def get_device_by_id(self, device_id):
+        """Device by id (or None)"""
+        with self._lock:
+            self._ensure_loaded()
+            return self._lookup(self._by_id.get(device_id))
+
+    def get_all_devices(self):
+        """All devices (list, roomID DESC)"""
+        with self._lock:
+            self._ensure_loaded()
+            self.hits += 1
+            return self._rows(self._by_pin)
+
+    def get_all_devices_for_room(self, room_id: int):
+        """Devices in room"""
+        with self._lock:
+            self._ensure_loaded()
+            self.hits += 1
+            return self._rows(self._by_room.get(room_id, ()))
+
+    def get_devices_by_type(self, device_type: int):
+        """Devices of one device_type_id"""
+        with self._lock:
+            self._ensure_loaded()
+            self.hits += 1
+            return self._rows(self._by_type.get(device_type, ()))
+
+    def get_all_buttons(self):
+        """All button devices (device_type_id=2)"""
+        return self.get_devices_by_type(2)
+
+    def get_all_devices_grouped_by_room(self):
+        """Devices grouped by room -> dict"""
+        grouped_devices = {}
+        for device in self.get_all_devices():
+            grouped_devices.setdefault(device["roomID"], []).append(device)
+        return grouped_devices
+
+    def get_number_of_rooms(self):
+        """List distinct roomIDs"""
+        with self._lock:
+            self._ensure_loaded()
+            self.hits += 1
+            return [{"roomID": room_id} for room_id, pins in self._by_room.items() if pins]
+
+    def snapshot(self):
+        """Consistent (all_devices, grouped_by_room, buttons) for one page render"""
+        with self._lock:
+            all_devices = self.get_all_devices()
+        grouped_devices = {}
+        for device in all_devices:
+            grouped_devices.setdefault(device["roomID"], []).append(device)
+        buttons = [device for device in all_devices if device["device_type_id"] == 2]
+        return all_devices, grouped_devices, buttons
+
+    def stats(self):
+        """Cache counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._by_pin),
+                "hits": self.hits,
+                "misses": self.misses,
+                "loads": self.loads,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+    # ---------------------- writes ----------------------
+
+    def add_device(self, device_name: str, pin: int, device_type: int, secondary_pin=None, room_id=0, button_type=None):
+        """Add device in DB, then cache the stored row"""
+        added = self.db.add_device(device_name, pin, device_type, secondary_pin=secondary_pin, room_id=room_id,
+                                   button_type=button_type)
+        if added:
+            row = self.db.get_device(pin)  # einmal zurücklesen, damit wir die id haben
+            with self._lock:
+                if row is not None and self._loaded:
+                    self._add_to_index(row)
+        return added
+
+    def remove_device(self, pin):
+        """Remove device in DB and cache"""
+        self.db.remove_device(pin)
+        with self._lock:
+            self._remove_from_index(pin)
+
+    def apply_device_states(self, changes):
+        """Persist (device_id, pin, state[, unix_ts]) changes in one transaction and update cache"""
+        self.db.apply_device_states(changes)
+        with self._lock:
+            for device_id, pin, state, *_ in changes:
+                row = self._by_pin.get(pin)
+                if row is not None:
+                    row["state"] = int(state) if isinstance(state, bool) else state
+
+    def update_device_state_by_pin(self, pin: int, state):
+        """Persist state and update cached row"""
+        self.db.update_device_state_by_pin(pin, state)
+        with self._lock:
+            row = self._by_pin.get(pin)
+            if row is not None:
+                # bool -> int wie SQLite es speichert
+                row["state"] = int(state) if isinstance(state, bool) else state
@@ -0,0 +1,67 @@
+import json
+import queue
+import threading
+
+# Kleiner Event-Bus für Server-Sent Events (SSE).
+# Jeder verbundene Client bekommt eine eigene Queue, publish() verteilt an alle.
+
+
+def format_sse(event: str, data) -> str:
+    """One SSE message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class EventBus:
+    """Fan-out of events to all connected stream clients"""
+    def __init__(self, max_queue=100, heartbeat_sec=15):
+        self.max_queue = max_queue
+        self.heartbeat_sec = heartbeat_sec  # Kommentarzeile, damit Proxies die Verbindung offen lassen
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def publish(self, event: str, data):
+        """Send event to all subscribers (never blocks the caller)"""
+        message = format_sse(event, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # Client hängt hinterher -> Stream beenden, EventSource verbindet sich neu
+                self.unsubscribe(q)
+                try:
+                    q.get_nowait()
+                    q.put_nowait(None)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def stream(self, q):
+        """Generator for the HTTP response body"""
+        yield "retry: 2000\n\n"  # Reconnect-Zeit für EventSource
+        while True:
+            try:
+                message = q.get(timeout=self.heartbeat_sec)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            if message is None:
+                return
+            yield message
+
+    def client_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+bus = EventBus()  # gemeinsame Instanz für Webserver, Buttons und Sampler
@@ -0,0 +1,122 @@
+import threading
+import time
+
+# Simuliertes RPi.GPIO für Entwicklung und Benchmarks ohne Raspberry Pi.
+# Gleiche Namen wie RPi.GPIO (nur das, was wir im Projekt benutzen),
+# plus simulate_input() um Button-Flanken auszulösen.
+
+BCM = 11
+BOARD = 10
+OUT = 0
+IN = 1
+LOW = 0
+HIGH = 1
+RISING = 31
+FALLING = 32
+BOTH = 33
+PUD_OFF = 20
+PUD_DOWN = 21
+PUD_UP = 22
+
+io_delay = 0.0  # künstliche Dauer pro Hardware-Zugriff (Sekunden)
+
+_lock = threading.RLock()
+_mode = None
+_pins = {}       # pin -> {"direction": IN/OUT, "level": 0/1}
+_callbacks = {}  # pin -> (edge, callback, bouncetime_ms, last_fire)
+
+
+def _pins_of(channel):
+    return list(channel) if isinstance(channel, (list, tuple)) else [channel]
+
+
+def _io():
+    if io_delay:
+        time.sleep(io_delay)
+
+
+def setwarnings(flag):
+    pass
+
+
+def setmode(mode):
+    global _mode
+    _mode = mode
+
+
+def getmode():
+    return _mode
+
+
+def setup(channel, direction, pull_up_down=PUD_OFF, initial=None):
+    with _lock:
+        for pin in _pins_of(channel):
+            level = HIGH if pull_up_down == PUD_UP else LOW
+            if direction == OUT and initial is not None:
+                level = int(bool(initial))
+            _pins[pin] = {"direction": direction, "level": level}
+    _io()
+
+
+def output(channel, value):
+    values = _pins_of(value) if isinstance(value, (list, tuple)) else None
+    with _lock:
+        for i, pin in enumerate(_pins_of(channel)):
+            state = _pins.get(pin)
+            if state is None or state["direction"] != OUT:
+                # wie RPi.GPIO: Output nur auf konfigurierten Pins
+                raise RuntimeError("The GPIO channel has not been set up as an OUTPUT")
+            state["level"] = int(bool(values[i] if values else value))
+    _io()
+
+
+def input(channel):
+    with _lock:
+        state = _pins.get(channel)
+        if state is None:
+            raise RuntimeError("You must setup() the GPIO channel first")
+        level = state["level"]
+    _io()
+    return level
+
+
+def cleanup(channel=None):
+    with _lock:
+        pins = list(_pins) if channel is None else _pins_of(channel)
+        for pin in pins:
+            _pins.pop(pin, None)
+            _callbacks.pop(pin, None)
+
+
+def add_event_detect(channel, edge, callback=None, bouncetime=None):
+    with _lock:
+        if channel in _callbacks:
+            raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+        _callbacks[channel] = [edge, callback, bouncetime or 0, 0.0]
+
+
+def remove_event_detect(channel):
+    with _lock:
+        _callbacks.pop(channel, None)
+
+
+def simulate_input(channel, level):
+    """Drive an input pin and fire its edge callback like the GPIO thread would"""
+    with _lock:
+        state = _pins.setdefault(channel, {"direction": IN, "level": LOW})
+        old_level = state["level"]
+        state["level"] = int(bool(level))
+        detect = _callbacks.get(channel)
+    if detect is None or old_level == state["level"]:
+        return False
+    edge, callback, bouncetime, last_fire = detect
+    rising = state["level"] == HIGH
+    if edge == BOTH or (edge == RISING and rising) or (edge == FALLING and not rising):
+        now = time.monotonic()
+        if (now - last_fire) * 1000 < bouncetime:
+            return False  # Entprellung wie im echten Treiber
+        detect[3] = now
+        if callback is not None:
+            callback(channel)
+        return True
+    return False
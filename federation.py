@@ -0,0 +1,201 @@
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# HTTP-Client für die verlinkten Systeme aus api.conf.
+# Eine gemeinsame Session (Keep-Alive, Connection-Pool), Timeouts pro Peer
+# und paralleles Abfragen aller Peers statt einer nach dem anderen.
+# PeerStateCache sorgt dafür, dass die Startseite nie auf einen Peer wartet.
+
+
+class FederationClient:
+    """Pooled, parallel HTTP client for linked systems"""
+    def __init__(self, peers, timeout=(2.0, 5.0), max_workers=8):
+        self.peers = peers  # gleiche Liste wie api_list (url, token, optional timeout)
+        self.timeout = timeout  # (connect, read) in Sekunden
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max(len(peers), 1), pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="peer")
+        # Letzte Antwort pro (Peer, Pfad) mit ETag -> If-None-Match, bei 304 Daten von hier
+        self._etags = {}
+        self._etag_lock = threading.Lock()
+
+    def _url(self, peer, path):
+        separator = "&" if "?" in path else "?"
+        return peer["url"] + path + separator + "code=" + peer["token"]
+
+    def get(self, peer, path, timeout=None):
+        """GET path on one peer -> result dict (never raises)"""
+        result = {
+            "url": peer["url"],
+            "system_id": peer.get("system_id"),
+            "ok": False,
+            "status": None,
+            "data": None,
+            "error": None,
+        }
+        start = time.monotonic()
+        key = (peer["url"], path)
+        with self._etag_lock:
+            cached = self._etags.get(key)
+        headers = {"If-None-Match": cached[0]} if cached else None
+        try:
+            response = self.session.get(self._url(peer, path), headers=headers,
+                                        timeout=timeout or peer.get("timeout") or self.timeout)
+            result["status"] = response.status_code
+            if response.status_code == 304 and cached:
+                result["data"] = cached[1]  # nichts geändert -> letzte Antwort wiederverwenden
+                result["ok"] = True
+            elif response.status_code == 401:
+                result["error"] = "Authorisation failed"
+            elif response.status_code >= 400:
+                result["error"] = f"HTTP {response.status_code}"
+            else:
+                result["data"] = json.loads(response.text)  # API liefert JSON als String
+                result["ok"] = True
+                etag = response.headers.get("ETag")
+                with self._etag_lock:
+                    if etag:
+                        self._etags[key] = (etag, result["data"])
+                    else:
+                        self._etags.pop(key, None)
+        except requests.Timeout:
+            result["error"] = "timeout"
+        except (requests.RequestException, ValueError) as e:
+            result["error"] = str(e)
+        elapsed = time.monotonic() - start
+        result["elapsed"] = round(elapsed, 4)
+        metrics.PEER_DURATION.observe(elapsed, peer=peer["url"])
+        if not result["ok"]:
+            # Grund grob einteilen, damit die Label-Anzahl klein bleibt
+            reason = "timeout" if result["error"] == "timeout" else (f"http_{result['status']}" if result["status"] else "error")
+            metrics.PEER_FAILURES.inc(peer=peer["url"], reason=reason)
+        return result
+
+    def submit(self, fn, *args):
+        """Run fn(*args) on the peer thread pool -> Future"""
+        return self._executor.submit(fn, *args)
+
+    def get_all(self, path, timeout=None):
+        """GET path on all peers in parallel -> one result per peer (partial results ok)"""
+        futures = [self.submit(self.get, peer, path, timeout) for peer in list(self.peers)]
+        return [future.result() for future in futures]
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+class PeerStateCache:
+    """Cached peer device lists: TTL, stale-while-revalidate and a circuit breaker per peer"""
+    def __init__(self, client, path="/api/get/json", ttl=10.0, stale_ttl=300.0,
+                 failure_threshold=3, cooldown=60.0):
+        self.client = client
+        self.path = path
+        self.ttl = ttl                # so lange gilt ein Eintrag als frisch
+        self.stale_ttl = stale_ttl    # so lange zeigen wir alte Daten noch an
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown      # Pause nach zu vielen Fehlern (Circuit offen)
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def _entry(self, peer):
+        entry = self._entries.get(peer["url"])
+        if entry is None:
+            entry = {
+                "data": None,
+                "fetched_at": 0.0,
+                "refreshing": False,
+                "failures": 0,
+                "open_until": 0.0,
+                "status": None,
+                "error": None,
+                "elapsed": None,
+            }
+            self._entries[peer["url"]] = entry
+        return entry
+
+    def _start_refresh(self, peer, entry, now):
+        # Nur ein Refresh pro Peer gleichzeitig, und nicht solange der Circuit offen ist
+        if entry["refreshing"] or now < entry["open_until"]:
+            return None
+        entry["refreshing"] = True
+        return self.client.submit(self._refresh, peer)
+
+    def _refresh(self, peer):
+        result = self.client.get(peer, self.path)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entry(peer)
+            entry["refreshing"] = False
+            entry["status"] = result["status"]
+            entry["elapsed"] = result["elapsed"]
+            if result["ok"]:
+                entry["data"] = result["data"]
+                entry["fetched_at"] = now
+                entry["failures"] = 0
+                entry["open_until"] = 0.0
+                entry["error"] = None
+            else:
+                entry["failures"] += 1
+                entry["error"] = result["error"]
+                if entry["failures"] >= self.failure_threshold:
+                    # Circuit öffnen; nach dem Cooldown darf genau ein Versuch wieder durch
+                    entry["open_until"] = now + self.cooldown
+        return result
+
+    def get(self):
+        """Cached device lists + error messages; never waits for the network"""
+        now = time.monotonic()
+        device_lists = []
+        errors = []
+        with self._lock:
+            for peer in list(self.client.peers):
+                entry = self._entry(peer)
+                age = now - entry["fetched_at"]
+                if entry["data"] is None or age > self.ttl:
+                    self._start_refresh(peer, entry, now)  # im Hintergrund nachladen
+                if entry["data"] is not None and age <= self.stale_ttl:
+                    device_lists.append(entry["data"])
+                if entry["error"] == "Authorisation failed":
+                    errors.append('"' + peer["url"] + '" Authorisation failed')
+                elif entry["error"]:
+                    errors.append(peer["url"] + " is not available")
+        return device_lists, errors
+
+    def refresh_all(self, wait=False):
+        """Refresh every peer whose circuit is closed (parallel)"""
+        now = time.monotonic()
+        with self._lock:
+            futures = [self._start_refresh(peer, self._entry(peer), now) for peer in list(self.client.peers)]
+        if wait:
+            for future in futures:
+                if future is not None:
+                    future.result()
+
+    def status(self):
+        """Per-peer cache/circuit state"""
+        now = time.monotonic()
+        peers = []
+        with self._lock:
+            for peer in list(self.client.peers):
+                entry = self._entry(peer)
+                peers.append({
+                    "url": peer["url"],
+                    "system_id": peer.get("system_id"),
+                    "age": round(now - entry["fetched_at"], 1) if entry["data"] is not None else None,
+                    "status": entry["status"],
+                    "error": entry["error"],
+                    "elapsed": entry["elapsed"],
+                    "failures": entry["failures"],
+                    "circuit_open": now < entry["open_until"],
+                })
+        return peers
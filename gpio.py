@@ -0,0 +1,8 @@
+import os
+
+# GPIO-Backend wählen: echtes RPi.GPIO auf dem Pi,
+# Simulation mit SMARTHOME_FAKE_HW=1 (Entwicklung, Benchmarks).
+if os.environ.get("SMARTHOME_FAKE_HW") == "1":
+    import fake_gpio as GPIO  # noqa: F401
+else:
+    import RPi.GPIO as GPIO  # noqa: F401
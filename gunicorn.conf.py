@@ -0,0 +1,6 @@
+# gunicorn liest diese Datei automatisch, wenn es im Repo-Verzeichnis gestartet wird.
+# Genau ein Worker: Geräte-Cache, Button-Handler und GPIO-Zustand gibt es nur pro Prozess.
+# Parallelität kommt über Threads.
+workers = 1
+threads = 8
+bind = "0.0.0.0:5000"
@@ -1,24 +1,107 @@
-import RPi.GPIO as GPIO
+import time
+import threading
+
+from gpio import GPIO  # RPi.GPIO oder Simulation (SMARTHOME_FAKE_HW=1)
+import metrics
 
 # GPIO-Hilfsfunktionen für LED/Relais-Output.
 # Ich hab die API etwas "klassisch" gelassen (get/set Klassen), ist aber simpel zu lesen.
+# Shadow-Register: letzter Pegel jedes Outputs im Speicher -> Lesen ohne GPIO-Zugriff,
+# Toggle = ein einziger Write. reconcile() gleicht regelmäßig mit der Hardware ab.
+
+_shadow = {}  # pin -> True/False (nur Pins, die wir als Output kennen)
+_shadow_lock = threading.RLock()  # Lesen+Schreiben beim Toggle zusammen (GPIO-Thread vs. Requests)
 
 
-def setup_led(pin):
+def init_gpio():
+    """One-time GPIO setup at startup"""
+    GPIO.setwarnings(False)
+    GPIO.setmode(GPIO.BCM)
+    return True
+
+def _input(pin):
+    # GPIO lesen + Dauer für /metrics
+    start = time.perf_counter()
+    try:
+        return GPIO.input(pin)
+    finally:
+        metrics.GPIO_DURATION.observe(time.perf_counter() - start, op="read")
+
+def _write(pin, level):
+    start = time.perf_counter()
+    try:
+        GPIO.output(pin, level)
+    finally:
+        metrics.GPIO_DURATION.observe(time.perf_counter() - start, op="write")
+    with _shadow_lock:
+        _shadow[pin] = level == GPIO.HIGH  # erst nach erfolgreichem Write merken
+
+def setup_led(pin, initial=None):
     """Configure pin as OUTPUT"""
     GPIO.setmode(GPIO.BCM)  # BCM ist die normale GPIO-Nummerierung
-    GPIO.setup(pin, GPIO.OUT)
+    if initial is None:
+        GPIO.setup(pin, GPIO.OUT)
+        level = _input(pin)  # Pegel bleibt wie er war -> einmal lesen
+    else:
+        GPIO.setup(pin, GPIO.OUT, initial=initial)
+        level = initial
+    with _shadow_lock:
+        _shadow[pin] = level == GPIO.HIGH
+    return True
+
+def setup_many(levels):
+    """Configure several outputs at their start level ({pin: bool}) in two GPIO calls"""
+    GPIO.setmode(GPIO.BCM)
+    high = [pin for pin, on in levels.items() if on]
+    low = [pin for pin, on in levels.items() if not on]
+    # initial= setzt den Pegel direkt beim Umschalten auf Output -> kein kurzes Flackern
+    if high:
+        GPIO.setup(high, GPIO.OUT, initial=GPIO.HIGH)
+    if low:
+        GPIO.setup(low, GPIO.OUT, initial=GPIO.LOW)
+    with _shadow_lock:
+        _shadow.update({pin: bool(on) for pin, on in levels.items()})
     return True
 
 def clear_led(pin):
     """Release pin"""
     GPIO.cleanup(pin)  # Pin freigeben, sonst "hängt" er ggf. noch
+    with _shadow_lock:
+        _shadow.pop(pin, None)
+
+def state(pin):
+    """Output level (bool) from the shadow register"""
+    return get.led(pin)
+
+def reconcile():
+    """Compare shadow with hardware -> {pin: actual_state} for pins that drifted"""
+    drifted = {}
+    with _shadow_lock:
+        pins = list(_shadow.items())
+    for pin, expected in pins:
+        try:
+            actual = _input(pin) == GPIO.HIGH
+        except RuntimeError:
+            with _shadow_lock:
+                _shadow.pop(pin, None)  # Pin nicht mehr konfiguriert
+            continue
+        with _shadow_lock:
+            # Nur korrigieren, wenn inzwischen niemand geschrieben hat
+            if pin in _shadow and _shadow[pin] == expected and actual != expected:
+                _shadow[pin] = actual
+                drifted[pin] = actual
+    return drifted
 
 class get:
     # Read operations
     def led(pin):
+        if owns_gpio:
+            # Shadow nur im GPIO-Besitzer, andere Prozesse schreiben ggf. parallel
+            cached = _shadow.get(pin)
+            if cached is not None:
+                return cached
         try:
-            if GPIO.input(pin) == GPIO.HIGH:
+            if _input(pin) == GPIO.HIGH:
                 return True
             else:
                 return False
@@ -29,7 +112,7 @@ class set:
     # Write operations
     def led_on(pin, repeat=False):
         try:
-            GPIO.output(pin, GPIO.HIGH)
+            _write(pin, GPIO.HIGH)
             return True
 
         except RuntimeError as e:
@@ -41,7 +124,7 @@ class set:
 
     def led_off(pin, repeat=False):
         try:
-            GPIO.output(pin, GPIO.LOW)
+            _write(pin, GPIO.LOW)
             return True
 
         except RuntimeError as e:
@@ -67,17 +150,44 @@ class set:
             raise False
         
     def switch(pin):
-        """Toggle state"""
-        if get.led(pin):
-            set.led_off(pin)
-            return False
-        else:
-            set.led_on(pin)
-            return True
+        """Toggle state (one hardware write, current level from the shadow)"""
+        with _shadow_lock:
+            if get.led(pin):
+                set.led_off(pin)
+                return False
+            else:
+                set.led_on(pin)
+                return True
+
+    def _output(pin, level):
+        try:
+            _write(pin, level)
+        except RuntimeError:
+            setup_led(pin)  # Pin noch nicht als Output konfiguriert
+            _write(pin, level)
+
+    def switch_many(pins):
+        """Toggle several outputs in one pass -> {pin: new_state}; reverts all on error"""
+        with _shadow_lock:
+            current = {pin: get.led(pin) for pin in pins}
+            applied = []
+            try:
+                for pin in pins:
+                    set._output(pin, GPIO.LOW if current[pin] else GPIO.HIGH)
+                    applied.append(pin)
+            except Exception:
+                # Schon geschaltete Pins zurücksetzen, damit der Raum nicht halb umgeschaltet bleibt
+                for pin in applied:
+                    set._output(pin, GPIO.HIGH if current[pin] else GPIO.LOW)
+                raise
+        return {pin: not current[pin] for pin in pins}
+
+owns_gpio = True  # Webserver setzt das auf False, wenn er den Hardware-Lock nicht hat (dann kein Shadow)
 
 class Cleanup:
     def __del__(self):
         # Fallback clean-up on GC
-        GPIO.cleanup()  # wenn Python beendet wird, räumen wir GPIO auf
+        if owns_gpio:
+            GPIO.cleanup()  # wenn Python beendet wird, räumen wir GPIO auf
 
 cleanup_instance = Cleanup()
@@ -1,5 +1,10 @@
+import sys
 import webserver  # main entry, hier hängt der Flask-Server dran
 
-# Einstiegspunkt: Server direkt starten (macht im Webserver-Modul das Setup)
-# Ich lasse das hier bewusst super simpel, damit man beim Starten nix verpasst.
-webserver()
+# Einstiegspunkt: Import macht nichts, erst serve()/start() lädt Config, DB und startet den Server.
+# python main.py        -> Produktionsmodus (multi-threaded WSGI, kein Debugger)
+# python main.py --dev  -> Flask-Dev-Server (debug = "true" in .conf für den Debugger)
+if "--dev" in sys.argv:
+    webserver.start()
+else:
+    webserver.serve()
@@ -0,0 +1,176 @@
+import bisect
+import functools
+import threading
+import time
+
+# Kleine Metriken-Sammlung im Prometheus-Textformat (ohne prometheus_client).
+# Zähler/Histogramme leben im Prozess; /metrics im Webserver gibt sie aus.
+# observe()/inc() sind bewusst billig (ein Lock, ein bisect), da sie auf den Hot-Paths laufen.
+
+# Standard-Buckets in Sekunden (Requests, DB, Peers)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# GPIO-Zugriffe liegen im Mikrosekunden-Bereich
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01, 0.05)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines += self._render_items(items)
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_items(self, items):
+        return [f"{self.name}{_label_text(self.labels, key)} {_number(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)  # erster Bucket mit le >= value
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _render_items(self, items):
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _number(float(bound)) + '"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {_number(round(total, 6))}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    """All metrics of this process, rendered in registration order"""
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_DURATION = REGISTRY.register(Histogram(
+    "smarthome_http_request_duration_seconds", "Request latency per route", ("route", "method", "status")))
+DB_DURATION = REGISTRY.register(Histogram(
+    "smarthome_db_call_duration_seconds", "DBWrapper call duration per method", ("method",)))
+DB_ERRORS = REGISTRY.register(Counter(
+    "smarthome_db_call_errors_total", "DBWrapper calls that raised", ("method",)))
+GPIO_DURATION = REGISTRY.register(Histogram(
+    "smarthome_gpio_op_duration_seconds", "GPIO read/write duration", ("op",), buckets=FAST_BUCKETS))
+SENSOR_READ_DURATION = REGISTRY.register(Histogram(
+    "smarthome_sensor_read_duration_seconds", "Sensor measurement duration (cache hits excluded)", ("sensor",)))
+SENSOR_READ_FAILURES = REGISTRY.register(Counter(
+    "smarthome_sensor_read_failures_total", "Failed sensor reads", ("sensor", "reason")))
+SAMPLER_LAG = REGISTRY.register(Gauge(
+    "smarthome_sensor_sampler_lag_seconds", "Delay of the last sampler run behind its schedule", ("sensor",)))
+SAMPLER_LAG_HIST = REGISTRY.register(Histogram(
+    "smarthome_sensor_sampler_lag_distribution_seconds", "Sampler delay behind schedule", ("sensor",)))
+PEER_DURATION = REGISTRY.register(Histogram(
+    "smarthome_peer_request_duration_seconds", "Peer call latency per api.conf entry", ("peer",)))
+PEER_FAILURES = REGISTRY.register(Counter(
+    "smarthome_peer_request_failures_total", "Failed peer calls", ("peer", "reason")))
+BUTTON_EVENTS = REGISTRY.register(Counter(
+    "smarthome_button_events_total", "Button events by outcome", ("result",)))
+BUTTON_QUEUE_DELAY = REGISTRY.register(Histogram(
+    "smarthome_button_queue_delay_seconds", "Time from GPIO edge to dispatcher"))
+
+
+def render():
+    return REGISTRY.render()
+
+
+def instrument(obj, histogram=DB_DURATION, errors=DB_ERRORS, skip=()):
+    """Wrap all public methods of one instance with timing (instance attributes, class stays untouched)"""
+    for name in dir(type(obj)):
+        if name.startswith("_") or name in skip:
+            continue
+        method = getattr(obj, name)
+        if not callable(method):
+            continue
+        setattr(obj, name, _timed(method, name, histogram, errors))
+    return obj
+
+
+def _timed(method, name, histogram, errors):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            errors.inc(method=name)
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - start, method=name)
+    return wrapper
@@ -0,0 +1,100 @@
+import gzip
+import json
+import os
+import threading
+import time
+
+# Aufräum-Job für logs, history und sensor_readings (+ Rollups).
+# Löscht in kleinen Batches, damit der Writer nie lange blockiert ist,
+# archiviert optional nach gzip (JSON Lines) und gibt Platz per incremental_vacuum frei.
+
+DEFAULT_POLICIES = {
+    "logs": 30,
+    "history": 0,                   # 0 = für immer behalten
+    "sensor_readings": 30,          # Rohdaten; ältere Werte bleiben als Rollups erhalten
+    "sensor_rollup_minute": 90,
+    "sensor_rollup_hour": 730,
+    "sensor_rollup_day": 0,
+}
+
+
+class RetentionJob:
+    """Per-table retention (days) enforced in small batches"""
+    def __init__(self, db, policies=None, batch_size=500, archive_dir=None,
+                 interval_sec=3600, vacuum_pages=200, pause_sec=0.05):
+        self.db = db
+        self.policies = dict(DEFAULT_POLICIES if policies is None else policies)
+        self.batch_size = batch_size
+        self.archive_dir = archive_dir  # None = gelöschte Zeilen nicht archivieren
+        self.interval_sec = interval_sec
+        self.vacuum_pages = vacuum_pages
+        self.pause_sec = pause_sec  # kleine Pause zwischen Batches
+        self.last_run = None
+        self._thread = None
+
+    def _archive(self, table, rows):
+        # Ein gzip-Member pro Batch anhängen, eine Datei pro Tabelle und Monat
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"{table}-{time.strftime('%Y-%m')}.jsonl.gz")
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+
+    def prune(self, table, days):
+        """Delete rows older than `days` days -> number of deleted rows"""
+        cutoff = int(time.time()) - days * 86400
+        total = 0
+        while True:
+            if self.archive_dir:
+                rows = self.db.prune_table(table, cutoff, self.batch_size, fetch_rows=True)
+                if rows:
+                    self._archive(table, rows)
+                deleted = len(rows)
+            else:
+                deleted = self.db.prune_table(table, cutoff, self.batch_size)
+            total += deleted
+            if deleted < self.batch_size:
+                return total
+            time.sleep(self.pause_sec)
+
+    def run_once(self):
+        """One retention pass over all tables + incremental vacuum"""
+        start = time.monotonic()
+        summary = {}
+        for table, days in self.policies.items():
+            if days and days > 0:
+                summary[table] = self.prune(table, days)
+        if self.db.ensure_incremental_vacuum():
+            self.db.write_log("info", "retention", "Converted database to auto_vacuum=INCREMENTAL")
+        free_pages = self.db.get_freelist_count()
+        if free_pages:
+            self.db.incremental_vacuum(self.vacuum_pages)
+        deleted = sum(summary.values())
+        if deleted:
+            self.db.write_log("info", "retention", f"Pruned {deleted} rows {summary} in {time.monotonic() - start:.2f} secs")
+        self.last_run = {"at": int(time.time()), "deleted": summary, "free_pages": free_pages}
+        return self.last_run
+
+    def _loop(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Retention run failed: {e}")
+            time.sleep(self.interval_sec)
+
+    def start(self):
+        """Run in a background thread every interval_sec"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="retention", daemon=True)
+            self._thread.start()
+
+
+def policies_from_config(section):
+    """[RETENTION] <table>_days = N -> {table: N}"""
+    policies = dict(DEFAULT_POLICIES)
+    for table in DEFAULT_POLICIES:
+        value = section.get(f"{table}_days")
+        if value is not None and value.strip('"') != "":
+            policies[table] = int(value.strip('"'))
+    return policies
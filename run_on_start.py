@@ -1,6 +1,9 @@
 import random
 import string
 import socket
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime, timezone
 
 # Startup/helper functions (IDs, Token, IP)
@@ -37,3 +40,42 @@ class get:
             return lan_ip
         except Exception as e:
             return f"Error: {e}"
+
+
+class StartupTimer:
+    """Duration of each startup phase (config, db, schema, gpio, peers, ...)"""
+    def __init__(self):
+        self.started_at = time.time()
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        self.phases = []  # Reihenfolge wie ausgeführt
+        self.ready_after = None  # Sekunden bis der Server Requests annimmt
+
+    @contextmanager
+    def phase(self, name: str, deferred: bool = False):
+        start = time.monotonic()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            with self._lock:
+                self.phases.append({
+                    "phase": name,
+                    "secs": round(time.monotonic() - start, 4),
+                    "deferred": deferred,  # lief im Hintergrund nach dem Start
+                    "error": error,
+                })
+
+    def mark_ready(self):
+        self.ready_after = round(time.monotonic() - self._start, 4)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "started_at": int(self.started_at),
+                "ready_after": self.ready_after,
+                "phases": list(self.phases),
+            }
@@ -1,12 +1,20 @@
+import os
 import time
+import threading
 from typing import Dict, Any
 
+import metrics
+
 
 class _BME680Unavailable(Exception):
     pass
 
 
 def _load_driver():
+    if os.environ.get("SMARTHOME_FAKE_HW") == "1":
+        # Simulierter Sensor ohne I2C (Entwicklung, Benchmarks)
+        from sensors import fake_bme680
+        return fake_bme680.board, fake_bme680
     try:
         # Treiber erst bei Bedarf importieren (läuft sonst auf Nicht-RPi nicht)
         import board  # type: ignore
@@ -16,37 +24,100 @@ def _load_driver():
         raise _BME680Unavailable(str(e))
 
 
-def read_bme680(sea_level_pressure_hpa: float = 1013.25) -> Dict[str, Any]:
-    try:
-        board, adafruit_bme680 = _load_driver()
-    except _BME680Unavailable as e:
-        return {
-            "available": False,
-            "error": f"BME680 unavailable: {e}",
-        }
+class BME680Service:
+    """Persistent BME680 handle with serialized bus access and a max-age cache"""
+    def __init__(self, sea_level_pressure_hpa: float = 1013.25, retry_open_sec: float = 30.0):
+        self.sea_level_pressure_hpa = sea_level_pressure_hpa
+        self.retry_open_sec = retry_open_sec
+        self._lock = threading.Lock()  # immer nur ein Zugriff auf den I2C-Bus
+        self._sensor = None
+        self._open_error = None
+        self._open_failed_at = 0.0
+        self._last = None  # letzter erfolgreicher Messwert
+        self._last_at = 0.0
 
-    try:
-        # Sensor per I2C ansprechen und Werte lesen
-        i2c = board.I2C()
-        sensor = adafruit_bme680.Adafruit_BME680_I2C(i2c)
-        sensor.sea_level_pressure = sea_level_pressure_hpa
-        temperature_c = float(sensor.temperature)
-        temperature_f = (temperature_c * 9 / 5) + 32
-        humidity = float(sensor.humidity)
-        pressure_hpa = float(sensor.pressure)
-        gas_ohms = float(sensor.gas)
-
-        return {
-            "available": True,
-            "temperature_c": round(temperature_c, 2),
-            "temperature_f": round(temperature_f, 2),
-            "humidity": round(humidity, 2),
-            "pressure_hpa": round(pressure_hpa, 2),
-            "gas_ohms": round(gas_ohms, 0),
-            "timestamp": int(time.time()),
-        }
-    except Exception as e:
-        return {
-            "available": False,
-            "error": f"BME680 read failed: {e}",
-        }
+    def _open(self):
+        # Treiber + Bus nur einmal öffnen, danach wiederverwenden
+        if self._open_error and time.monotonic() - self._open_failed_at < self.retry_open_sec:
+            raise _BME680Unavailable(self._open_error)
+        try:
+            board, adafruit_bme680 = _load_driver()
+            i2c = board.I2C()
+            sensor = adafruit_bme680.Adafruit_BME680_I2C(i2c)
+        except Exception as e:
+            self._open_error = str(e)
+            self._open_failed_at = time.monotonic()
+            raise _BME680Unavailable(str(e))
+        self._open_error = None
+        return sensor
+
+    def _cached(self, max_age: float):
+        if self._last is not None and max_age > 0 and time.monotonic() - self._last_at <= max_age:
+            return dict(self._last, cached=True)
+        return None
+
+    def read(self, max_age: float = 0) -> Dict[str, Any]:
+        """Reading not older than max_age seconds (0 = always measure)"""
+        cached = self._cached(max_age)
+        if cached:
+            return cached
+        with self._lock:
+            # Evtl. hat ein anderer Thread gerade gemessen, während wir gewartet haben
+            cached = self._cached(max_age)
+            if cached:
+                return cached
+            try:
+                if self._sensor is None:
+                    self._sensor = self._open()
+            except _BME680Unavailable as e:
+                metrics.SENSOR_READ_FAILURES.inc(sensor="bme680", reason="unavailable")
+                return {
+                    "available": False,
+                    "error": f"BME680 unavailable: {e}",
+                }
+
+            start = time.perf_counter()
+            try:
+                # Sensor per I2C ansprechen und Werte lesen
+                sensor = self._sensor
+                sensor.sea_level_pressure = self.sea_level_pressure_hpa
+                temperature_c = float(sensor.temperature)
+                temperature_f = (temperature_c * 9 / 5) + 32
+                humidity = float(sensor.humidity)
+                pressure_hpa = float(sensor.pressure)
+                gas_ohms = float(sensor.gas)
+            except Exception as e:
+                self._sensor = None  # beim nächsten Mal neu öffnen
+                metrics.SENSOR_READ_FAILURES.inc(sensor="bme680", reason="read")
+                return {
+                    "available": False,
+                    "error": f"BME680 read failed: {e}",
+                }
+
+            metrics.SENSOR_READ_DURATION.observe(time.perf_counter() - start, sensor="bme680")
+
+            reading = {
+                "available": True,
+                "temperature_c": round(temperature_c, 2),
+                "temperature_f": round(temperature_f, 2),
+                "humidity": round(humidity, 2),
+                "pressure_hpa": round(pressure_hpa, 2),
+                "gas_ohms": round(gas_ohms, 0),
+                "timestamp": int(time.time()),
+            }
+            self._last = reading
+            self._last_at = time.monotonic()
+            return dict(reading, cached=False)
+
+    def latest(self):
+        """Last successful reading from memory (or None)"""
+        last = self._last
+        return dict(last, cached=True) if last else None
+
+
+bme680 = BME680Service()  # eine gemeinsame Instanz für Webserver und Sampler
+
+
+def read_bme680(sea_level_pressure_hpa: float = 1013.25, max_age: float = 0) -> Dict[str, Any]:
+    bme680.sea_level_pressure_hpa = sea_level_pressure_hpa
+    return bme680.read(max_age)
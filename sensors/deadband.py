@@ -0,0 +1,86 @@
+import threading
+import time
+
+# Deadband-Filter vor dem Speichern: ein Messwert wird nur geschrieben, wenn sich
+# mindestens ein Feld um mehr als seinen Schwellwert geändert hat oder seit dem letzten
+# gespeicherten Wert "heartbeat" Sekunden vergangen sind (Lebenszeichen).
+# Zwischen zwei gespeicherten Werten gilt der ältere (Treppenkurve), Fehler < Schwellwert.
+
+# Feld -> Schwellwert; "5%" = relativ zum zuletzt gespeicherten Wert
+DEFAULT_THRESHOLDS = {
+    "temperature_c": "0.2",
+    "humidity": "1.0",
+    "pressure_hpa": "0.5",
+    "gas_ohms": "5%",
+}
+DEFAULT_HEARTBEAT = 600  # Sekunden (0 = jeden Wert speichern)
+
+
+def _parse_threshold(value):
+    value = str(value).strip().strip('"')
+    if value.endswith("%"):
+        return float(value[:-1]) / 100.0, True
+    return float(value), False
+
+
+class DeadbandFilter:
+    """Decides per sample whether it is worth storing"""
+    def __init__(self, thresholds=None, heartbeat_sec=DEFAULT_HEARTBEAT):
+        self.thresholds = {
+            field: _parse_threshold(value)
+            for field, value in (thresholds or DEFAULT_THRESHOLDS).items()
+        }
+        self.heartbeat_sec = heartbeat_sec
+        self._lock = threading.Lock()
+        self._last = {}  # sensor_type -> (timestamp, reading) des zuletzt gespeicherten Werts
+        self.accepted = 0
+        self.skipped = 0
+
+    def _changed(self, last, reading):
+        for field, (threshold, relative) in self.thresholds.items():
+            old, new = last.get(field), reading.get(field)
+            if (old is None) != (new is None):
+                return True  # Feld kommt/geht -> immer speichern
+            if old is None:
+                continue
+            limit = abs(old) * threshold if relative else threshold
+            if abs(new - old) >= limit:
+                return True
+        return False
+
+    def accept(self, sensor_type, reading):
+        """True if the reading should be stored (and remember it as the new reference)"""
+        ts = int(reading.get("timestamp") or time.time())
+        with self._lock:
+            last = self._last.get(sensor_type)
+            store = (
+                last is None
+                or ts - last[0] >= self.heartbeat_sec
+                or ts < last[0]  # Uhr zurückgestellt -> neu anfangen
+                or self._changed(last[1], reading)
+            )
+            if store:
+                self._last[sensor_type] = (ts, reading)
+                self.accepted += 1
+            else:
+                self.skipped += 1
+        return store
+
+    def stats(self):
+        total = self.accepted + self.skipped
+        return {
+            "accepted": self.accepted,
+            "skipped": self.skipped,
+            "stored_ratio": round(self.accepted / total, 3) if total else None,
+            "heartbeat_sec": self.heartbeat_sec,
+        }
+
+
+def filter_from_config(section):
+    """[DEADBAND] section: one key per field (value or value%), heartbeat in seconds"""
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    for field in DEFAULT_THRESHOLDS:
+        if section.get(field):
+            thresholds[field] = section.get(field)
+    heartbeat = int(str(section.get("heartbeat", DEFAULT_HEARTBEAT)).strip('"') or DEFAULT_HEARTBEAT)
+    return DeadbandFilter(thresholds, heartbeat)
@@ -0,0 +1,73 @@
+import csv
+import io
+import json
+import math
+import struct
+import zlib
+
+# Export-Formate für die Sensor-Historie, alle als Generatoren (Chunk für Chunk aus dem Cursor),
+# damit auch ein Jahr Daten nie komplett im RAM des Pi liegt.
+# chunks(columns) kommt aus DBWrapper.sensor_export und liefert Listen von Tupeln.
+
+# Binärformat: b"SHB1", uint16 Spaltenanzahl, je Spalte uint8 Länge + Name (ASCII),
+# danach Datensätze little-endian: ts/samples als uint32, Messwerte als float32 (NaN = fehlt)
+BINARY_MAGIC = b"SHB1"
+INT_COLUMNS = ("ts", "samples")
+
+
+def columnar_json(columns, chunks, meta=None):
+    """{"columns": [...], "data": {column: [values]}} – one pass per column"""
+    head = dict(meta or {}, columns=columns)
+    yield json.dumps(head)[:-1] + ', "data": {'
+    for index, column in enumerate(columns):
+        yield ("" if index == 0 else ", ") + json.dumps(column) + ": ["
+        first = True
+        for rows in chunks([column]):
+            values = json.dumps([row[0] for row in rows])[1:-1]
+            yield values if first else "," + values
+            first = False
+        yield "]"
+    yield "}}"
+
+
+def csv_stream(columns, chunks):
+    """CSV with header line"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks(columns):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def packed_binary(columns, chunks):
+    """Fixed-size little-endian records (see BINARY_MAGIC above)"""
+    header = bytearray(BINARY_MAGIC + struct.pack("<H", len(columns)))
+    for column in columns:
+        name = column.encode("ascii")
+        header += struct.pack("<B", len(name)) + name
+    yield bytes(header)
+    record = struct.Struct("<" + "".join("I" if column in INT_COLUMNS else "f" for column in columns))
+    int_flags = [column in INT_COLUMNS for column in columns]
+    for rows in chunks(columns):
+        out = bytearray()
+        for row in rows:
+            out += record.pack(*[
+                int(value or 0) if is_int else (math.nan if value is None else value)
+                for value, is_int in zip(row, int_flags)
+            ])
+        yield bytes(out)
+
+
+def gzip_stream(parts, level=6):
+    """Compress a stream of str/bytes parts on the fly (gzip container)"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = gzip-Header
+    for part in parts:
+        data = compressor.compress(part.encode() if isinstance(part, str) else part)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,53 @@
+import math
+import random
+import threading
+import time
+import types
+
+# Simulierter BME680 (gleiche Schnittstelle wie adafruit_bme680) für Tests ohne I2C.
+# measurement_delay bildet die Dauer einer echten Messung inkl. Gas-Heizer nach.
+
+measurement_delay = 0.15  # Sekunden pro Messung
+refresh_time = 0.1  # wie adafruit_bme680 (refresh_rate=10): Werte so lange wiederverwenden
+
+board = types.SimpleNamespace(I2C=lambda: object())
+
+
+class Adafruit_BME680_I2C:
+    def __init__(self, i2c, address=0x77):
+        self.sea_level_pressure = 1013.25
+        self._lock = threading.Lock()
+        self._start = time.time()
+        self._values = None
+        self._read_at = 0.0
+
+    def _measure(self):
+        # Eine "Messung" liefert alle Werte, wie beim echten Sensor
+        with self._lock:
+            if self._values is None or time.monotonic() - self._read_at > refresh_time:
+                time.sleep(measurement_delay)
+                phase = (time.time() - self._start) / 600.0
+                self._values = {
+                    "temperature": 21.0 + 1.5 * math.sin(phase) + random.uniform(-0.05, 0.05),
+                    "humidity": 45.0 + 5 * math.cos(phase) + random.uniform(-0.2, 0.2),
+                    "pressure": self.sea_level_pressure - 2 + random.uniform(-0.1, 0.1),
+                    "gas": 50000 + random.uniform(-500, 500),
+                }
+                self._read_at = time.monotonic()
+            return self._values
+
+    @property
+    def temperature(self):
+        return self._measure()["temperature"]
+
+    @property
+    def humidity(self):
+        return self._measure()["humidity"]
+
+    @property
+    def pressure(self):
+        return self._measure()["pressure"]
+
+    @property
+    def gas(self):
+        return self._measure()["gas"]
@@ -0,0 +1,141 @@
+import heapq
+import threading
+import time
+
+import metrics
+
+# Sampling-Scheduler für mehrere Sensoren.
+# Jeder Sensor hat sein eigenes Intervall; Termine laufen auf einem festen Raster
+# (due += interval), damit sich Lesedauer und Sleep-Verzug nicht aufsummieren.
+# Fehler -> exponentielles Backoff, damit ein kaputter Sensor nicht dauernd gepollt wird.
+# Alle Messwerte, die im selben Tick fällig sind, gehen gesammelt an on_samples.
+
+
+class _Sensor:
+    def __init__(self, name, read, interval, max_backoff):
+        self.name = name
+        self.read = read              # () -> dict mit "available"
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.due = 0.0
+        self.last_ok = None           # Unix-Zeit der letzten erfolgreichen Messung
+        self.last_error = None
+
+
+class SensorScheduler:
+    """Runs registered sensor reads on a drift-free schedule with backoff on failure"""
+    def __init__(self, on_samples, max_backoff=300.0):
+        self.on_samples = on_samples  # callback([(sensor_type, reading), ...])
+        self.max_backoff = max_backoff
+        self._sensors = {}
+        self._heap = []  # (due, name)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def register(self, name, read, interval, max_backoff=None):
+        """Add a sensor; first read happens right away"""
+        sensor = _Sensor(name, read, float(interval), max_backoff or self.max_backoff)
+        sensor.due = time.monotonic()
+        with self._lock:
+            self._sensors[name] = sensor
+            heapq.heappush(self._heap, (sensor.due, name))
+        self._wakeup.set()  # Loop neu planen lassen
+        return sensor
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="sensor-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+    def _next_due(self):
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def _pop_due(self, now):
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, name = heapq.heappop(self._heap)
+                sensor = self._sensors.get(name)
+                if sensor is not None:
+                    due.append(sensor)
+        return due
+
+    def _reschedule(self, sensor, ok, now):
+        if ok:
+            sensor.failures = 0
+            # Auf dem Raster bleiben; verpasste Termine überspringen statt nachzuholen
+            sensor.due += sensor.interval
+            if sensor.due <= now:
+                missed = int((now - sensor.due) // sensor.interval) + 1
+                sensor.due += missed * sensor.interval
+        else:
+            sensor.failures += 1
+            backoff = min(sensor.interval * (2 ** sensor.failures), sensor.max_backoff)
+            sensor.due = now + max(backoff, sensor.interval)
+        with self._lock:
+            heapq.heappush(self._heap, (sensor.due, sensor.name))
+
+    def _read(self, sensor, now):
+        lag = max(0.0, now - sensor.due)
+        metrics.SAMPLER_LAG.set(round(lag, 4), sensor=sensor.name)
+        metrics.SAMPLER_LAG_HIST.observe(lag, sensor=sensor.name)
+        try:
+            reading = sensor.read()
+        except Exception as e:
+            reading = {"available": False, "error": str(e)}
+        if reading.get("available"):
+            sensor.last_ok = int(time.time())
+            sensor.last_error = None
+            return reading
+        sensor.last_error = reading.get("error")
+        return None
+
+    def tick(self, now=None):
+        """Read every sensor that is due, store the samples in one batch -> number stored"""
+        now = time.monotonic() if now is None else now
+        samples = []
+        for sensor in self._pop_due(now):
+            reading = self._read(sensor, now)
+            self._reschedule(sensor, reading is not None, time.monotonic())
+            if reading is not None:
+                samples.append((sensor.name, reading))
+        if samples:
+            try:
+                self.on_samples(samples)
+            except Exception as e:
+                print(f"Storing sensor samples failed: {e}")
+        return len(samples)
+
+    def _loop(self):
+        while not self._stopped:
+            next_due = self._next_due()
+            timeout = None if next_due is None else max(0.0, next_due - time.monotonic())
+            if timeout is None or timeout > 0:
+                self._wakeup.wait(timeout)
+                self._wakeup.clear()
+                continue  # aufgeweckt oder Zeit erreicht -> neu prüfen
+            self.tick()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            sensors = list(self._sensors.values())
+        return [
+            {
+                "sensor": s.name,
+                "interval": s.interval,
+                "failures": s.failures,
+                "next_in": round(max(0.0, s.due - now), 3),
+                "last_ok": s.last_ok,
+                "last_error": s.last_error,
+            }
+            for s in sensors
+        ]
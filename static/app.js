@@ -91,6 +91,26 @@ function bindDeviceFilter(){
 }
 window.addEventListener("load", bindDeviceFilter);
 
+// Live-Updates per Server-Sent Events (eine Verbindung pro Seite)
+let eventSource = null;
+function openEventStream(code){
+  if(!window.EventSource) return null;
+  if(!eventSource){
+    eventSource = new EventSource(`/api/events?code=${encodeURIComponent(code)}`);
+    // Gerätestatus überall aktualisieren, wo ein Pill mit data-state-pin steht
+    eventSource.addEventListener("device", (e)=>{
+      const d = JSON.parse(e.data);
+      $all(`[data-state-pin="${d.pin}"]`).forEach(el => renderStatePill(el, d.state));
+    });
+  }
+  return eventSource;
+}
+
+function renderStatePill(el, on){
+  el.innerHTML = `<span class="dot ${on ? "dot--on" : "dot--off"}"></span>${on ? "On" : "Off"}`;
+}
+window.openEventStream = openEventStream;
+
 // Remove device/button with confirm
 function confirmRemove(url){
   // Sicherheitsabfrage, damit man nicht aus Versehen löscht
@@ -1,74 +1,310 @@
-from flask import Flask, render_template, redirect, request, url_for, render_template_string, flash, abort, jsonify
+from flask import Flask, render_template, redirect, request, url_for, render_template_string, flash, abort, jsonify, Response, g, make_response, session
+import os
+from datetime import datetime, timezone
 import threading
 import time as _time
-import os
 import led as LEDC
 import file_access as FA
-import requests
-import json
 import urllib.parse
 import configparser
 import run_on_start as setup2
+import metrics
 from db import DBWrapper
+from federation import FederationClient, PeerStateCache
+from events import bus
+from retention import RetentionJob, policies_from_config
+from device_registry import DeviceRegistry
 from buttons.press_button import PressButton
 from buttons.switch_button import SwitchButton
+from buttons.dispatcher import dispatcher as button_dispatcher
+from buttons.button import setup_inputs
 from sensors.bme680_sensor import read_bme680
+from sensors.scheduler import SensorScheduler
+from sensors.deadband import filter_from_config
+from sensors import export as sensor_export
 
 # Zentraler Flask-Server für das Mini-Smart-Home.
 # Ich habe hier alles in einer Datei gelassen, damit man es schnell findet.
 # Kernfeatures: Devices verwalten, Buttons, Remote-API, Historie.
 
 buttons = []  # Liste der Button-Objekte (bleibt im Speicher)
+HISTORY_PAGE_SIZE = 200  # History-Einträge pro Seite (/stats und /api/history)
 
 from exceptions import DeviceTypeNotFoundException  # eigene Exception für falsche Device-Typen
 
 app = Flask(__name__)  # Flask-Instanz
 
+@app.before_request
+def _start_request_timer():
+    g.request_started = _time.perf_counter()
+
+@app.after_request
+def _record_request_metrics(response):
+    # Route-Muster statt URL als Label (/device/<pin>/ statt jeder einzelnen Pin)
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.HTTP_DURATION.observe(_time.perf_counter() - started, route=route,
+                                      method=request.method, status=response.status_code)
+    return response
+
 config = configparser.ConfigParser()
-config.read('.conf')  # Lokale Konfiguration laden (.conf liegt im Repo)
-
-# Secret-Key ist nötig für Flask-Flash-Nachrichten
-if config['SYSTEM']['secret_key'].strip('"') != " ":
-    app.secret_key = config['SYSTEM']['secret_key'].strip('"')  # vorhandenen Key nutzen
-else:
-    secret_key = str(setup2.generate.token())  # sonst neuen Token bauen
-    app.secret_key = secret_key
-    config.set('SYSTEM', 'secret_key', f'"{secret_key}"')
-
-# System-ID wird für API-Identifikation verwendet
-if config['SYSTEM']['system_id'].strip('"') != " ":
-    system_id = config['SYSTEM']['system_id'].strip('"')
-else:
-    system_id = str(setup2.generate.system_id())
-    config.set('SYSTEM', 'system_id', f'"{system_id}"')
-
-global api_active
-global api_token
-global api_list
-api_active = bool(config['DEFAULT']['api_active'].strip('"'))  # API-Feature an/aus
-
-api_config = configparser.ConfigParser()
-api_config.read('api.conf')  # Liste der externen APIs
 
+# Globale Objekte; werden erst in create_app() befüllt (Import macht kein I/O)
 api_list = []  # verlinkte externe Systeme
-for api_group in api_config:
-    if api_group != "DEFAULT":
-        api_list += [{"url": api_config[api_group]['url'].strip('"'), "token": api_config[api_group]['token'].strip('"')}]
+api_active = False
+connect2api = "false"
+system_id = None
+access_token = None
+access_url = None
+db = None
+registry = None
+federation = None
+peer_cache = None
+retention_job = None
+sensor_filter = None  # Deadband: nur relevante Änderungen + Heartbeat speichern
+owns_hardware = False  # nur ein Prozess darf GPIO/Sampler besitzen
+_hardware_lock_file = None
+_initialized = False
+_init_lock = threading.Lock()
+startup_timer = setup2.StartupTimer()  # Dauer der einzelnen Startphasen
+
+def load_config(config_path='.conf', api_config_path='api.conf'):
+    """Read .conf/api.conf into the module globals"""
+    global api_active, api_list, connect2api, system_id, access_token, access_url
+    config.read(config_path)  # Lokale Konfiguration laden (.conf liegt im Repo)
+    changed = False
+
+    # Secret-Key ist nötig für Flask-Flash-Nachrichten
+    if config['SYSTEM']['secret_key'].strip('"') != " ":
+        app.secret_key = config['SYSTEM']['secret_key'].strip('"')  # vorhandenen Key nutzen
+    else:
+        secret_key = str(setup2.generate.token())  # sonst neuen Token bauen
+        app.secret_key = secret_key
+        config.set('SYSTEM', 'secret_key', f'"{secret_key}"')
+        changed = True
+
+    # System-ID wird für API-Identifikation verwendet
+    if config['SYSTEM']['system_id'].strip('"') != " ":
+        system_id = config['SYSTEM']['system_id'].strip('"')
+    else:
+        system_id = str(setup2.generate.system_id())
+        config.set('SYSTEM', 'system_id', f'"{system_id}"')
+        changed = True
 
-global connect2api
-global access_url
-connect2api = config['SYSTEM']['connect2api']
-access_token = config['DEFAULT']['access_token'].strip('"')  # Anführungszeichen weg
+    api_active = bool(config['DEFAULT']['api_active'].strip('"'))  # API-Feature an/aus
 
-# Access-URL: entweder aus Config oder dynamisch bauen
-if config['DEFAULT']['access_url'].strip('"') != "":
-    access_url = config['DEFAULT']['access_url'].strip('"')
-else:
-    access_url = "http://" + setup2.get.ip() + ":" + config['DEFAULT']['port'].strip('"')
-access_url = urllib.parse.quote(access_url)  # URL-encoding fürs Weiterreichen
+    api_config = configparser.ConfigParser()
+    api_config.read(api_config_path)  # Liste der externen APIs
 
-with open('.conf', 'w') as configfile:
-    config.write(configfile)  # Änderungen (z.B. neue IDs) zurückschreiben
+    api_list.clear()
+    for api_group in api_config:
+        if api_group != "DEFAULT":
+            api_list.append({"url": api_config[api_group]['url'].strip('"'), "token": api_config[api_group]['token'].strip('"')})
+            if api_config[api_group].get('timeout'):
+                api_list[-1]['timeout'] = float(api_config[api_group]['timeout'].strip('"'))  # eigener Timeout pro Peer
+
+    connect2api = config['SYSTEM']['connect2api']
+    access_token = config['DEFAULT']['access_token'].strip('"')  # Anführungszeichen weg
+
+    # Access-URL: aus Config, sonst später im Hintergrund über die LAN-IP bauen
+    if config['DEFAULT']['access_url'].strip('"') != "":
+        access_url = urllib.parse.quote(config['DEFAULT']['access_url'].strip('"'))  # URL-encoding fürs Weiterreichen
+    else:
+        access_url = None
+
+    if changed:
+        with open(config_path, 'w') as configfile:
+            config.write(configfile)  # Änderungen (z.B. neue IDs) zurückschreiben
+
+def init_db():
+    """Open database, create schema and load the device registry"""
+    global db, registry, _latest_sensor
+    # write_behind = "true" -> Schreibzugriffe gebündelt über einen Writer-Thread (weniger fsyncs)
+    write_behind = config['DEFAULT'].get('write_behind', 'false').strip('"') == "true"
+    db = DBWrapper(
+        config["DEFAULT"]["db_name"],
+        write_behind=write_behind,
+        read_pool_size=int(config['DEFAULT'].get('db_read_pool', '4').strip('"') or 4),  # parallele Leser
+    )  # SQLite-Wrapper
+    # Dauer/Fehler pro DB-Methode für /metrics (Hilfsfunktionen ohne I/O auslassen)
+    metrics.instrument(db, skip=('dict_factory', 'group_by_minute', 'pick_sensor_resolution'))
+    with startup_timer.phase('db'):
+        db.init_db()
+    with startup_timer.phase('schema'):
+        db.init_tables()
+    with startup_timer.phase('registry'):
+        registry = DeviceRegistry(db)  # Geräte-Cache, alle Device-Lesezugriffe laufen hierüber
+        registry.load()
+    # Letzter Sensorwert im Speicher; beim Start einmal aus der DB vorbelegen
+    _latest_sensor = db.get_latest_sensor_reading('bme680')
+
+def init_sensor_filter():
+    """Deadband/heartbeat filter for stored sensor readings ([DEADBAND] section in .conf)"""
+    global sensor_filter
+    section = config['DEADBAND'] if config.has_section('DEADBAND') else config['DEFAULT']
+    sensor_filter = filter_from_config(section)
+
+def init_federation():
+    """HTTP client and device cache for the linked systems"""
+    global federation, peer_cache
+    try:
+        peer_timeout = float(config['DEFAULT'].get('peer_timeout', '3').strip('"') or 3)
+    except ValueError:
+        peer_timeout = 3.0
+    federation = FederationClient(api_list, timeout=peer_timeout)  # gemeinsame Session für alle Peers
+    # Geräte-Listen der Peers: frisch für peer_ttl Sekunden, danach alt aber noch anzeigbar bis peer_stale
+    peer_cache = PeerStateCache(
+        federation,
+        ttl=float(config['DEFAULT'].get('peer_ttl', '10').strip('"') or 10),
+        stale_ttl=float(config['DEFAULT'].get('peer_stale', '300').strip('"') or 300),
+    )
+
+def create_app(config_path='.conf', api_config_path='api.conf', start_services=True):
+    """App factory: config, DB, peers and (optionally) background services; runs once per process"""
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return app
+        with startup_timer.phase('config'):
+            load_config(config_path, api_config_path)
+        init_db()
+        init_sensor_filter()
+        with startup_timer.phase('gpio'):
+            try:
+                LEDC.init_gpio()
+            except Exception as e:
+                print(f"GPIO init failed: {e}")
+        init_federation()
+        button_dispatcher.on_batch = _buttons_applied  # Button-Events -> State/History/SSE
+        button_dispatcher.start()
+        if start_services:
+            start_background_services()
+        else:
+            # Ohne Hardware-Lock kann ein anderer Prozess die Pins schalten -> Shadow-Register
+            # nicht verwenden, jeder Read geht an die Hardware
+            LEDC.owns_gpio = False
+        _initialized = True
+        startup_timer.mark_ready()
+        # IP und Peers brauchen Netzwerk -> erst nach dem Start im Hintergrund
+        threading.Thread(target=_deferred_startup, name="deferred-startup", daemon=True).start()
+    return app
+
+def _detect_access_url():
+    """Build access URL from the LAN IP (slow: needs a network route)"""
+    global access_url
+    access_url = urllib.parse.quote("http://" + setup2.get.ip() + ":" + config['DEFAULT']['port'].strip('"'))
+
+def _start_retention():
+    """Background retention job ([RETENTION] section in .conf)"""
+    global retention_job
+    section = config['RETENTION'] if config.has_section('RETENTION') else config['DEFAULT']
+    archive_dir = section.get('archive_dir', '').strip('"')
+    retention_job = RetentionJob(
+        db,
+        policies=policies_from_config(section),
+        batch_size=int(section.get('batch_size', '500').strip('"') or 500),
+        archive_dir=archive_dir or None,  # leer = nicht archivieren
+        interval_sec=int(section.get('interval', '3600').strip('"') or 3600),
+    )
+    retention_job.start()
+
+def _deferred_startup():
+    """Network-dependent startup steps, then write the phase timings to logs"""
+    if access_url is None:
+        with startup_timer.phase('ip', deferred=True):
+            _detect_access_url()
+    with startup_timer.phase('peers', deferred=True):
+        try:
+            call_api_info()
+        except Exception as e:
+            print(f"Peer discovery failed: {e}")
+    timings = startup_timer.as_dict()
+    for phase in timings['phases']:
+        db.write_log('info', 'startup_phase', f"{phase['phase']}: {phase['secs']:.3f} secs" + (" (deferred)" if phase['deferred'] else ""))
+    db.write_log('info', 'startup', f"Ready for requests after {timings['ready_after']:.3f} secs")
+
+def _acquire_hardware_lock():
+    """File lock: True if this process may own GPIO and the sampler"""
+    global _hardware_lock_file
+    try:
+        import fcntl
+    except ImportError:
+        return True  # kein fcntl (z.B. Windows) -> wir gehen von einem Prozess aus
+    lock_file = open(config['DEFAULT'].get('hardware_lock', '.hardware.lock').strip('"'), 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _hardware_lock_file = lock_file  # offen lassen, solange der Prozess läuft
+    return True
+
+def start_background_services():
+    """Hardware restore, sampler, retention and peer refresh; refuses to run next to another server process"""
+    global owns_hardware
+    owns_hardware = _acquire_hardware_lock()
+    LEDC.owns_gpio = owns_hardware  # nur der Besitzer räumt GPIO beim Beenden auf
+    if not owns_hardware:
+        # Geräte-Cache, Button-Handler, GPIO-Shadow und Änderungszähler gibt es nur pro Prozess ->
+        # ein zweiter Worker würde mit veralteten Daten antworten. Also gar nicht erst starten.
+        raise RuntimeError("Another process already serves this installation (hardware lock held); run a single worker")
+    with startup_timer.phase('restore'):
+        restore_hardware()
+    _maybe_start_sampler()
+    _start_retention()
+    _maybe_start_gpio_reconcile()
+    _maybe_start_peer_refresh()
+
+BUTTON_TYPES = {1: SwitchButton, 2: PressButton}  # button_type in der DB -> Klasse
+
+def restore_hardware():
+    """Boot: outputs back to their last state and button handlers recreated (one device read)"""
+    start = _time.monotonic()
+    devices = registry.get_all_devices()  # Registry ist schon geladen -> keine Query
+    outputs = {int(d['pin']): bool(d['state']) for d in devices if d['device_type_id'] == 1}
+    button_rows = [d for d in devices if d['device_type_id'] == 2 and d.get('secondary_pin') is not None]
+    for d in button_rows:
+        # Output ohne eigenes Gerät: Zustand steht am Button (siehe _buttons_applied)
+        outputs.setdefault(int(d['secondary_pin']), bool(d['state']))
+    LEDC.setup_many(outputs)  # alle Outputs direkt mit dem letzten Pegel
+    setup_inputs([int(d['pin']) for d in button_rows])
+    restored = 0
+    for d in button_rows:
+        if any(btn.input_pin == int(d['pin']) for btn in buttons):
+            continue  # läuft schon
+        # Alte Einträge ohne button_type -> Switch (häufigster Fall)
+        button_class = BUTTON_TYPES.get(d.get('button_type') or 1, SwitchButton)
+        try:
+            buttons.append(button_class(int(d['pin']), int(d['secondary_pin']), setup_pins=False))
+            restored += 1
+        except RuntimeError as e:
+            print(f"Button on pin {d['pin']} could not be restored: {e}")
+    secs = _time.monotonic() - start
+    db.write_log('info', 'restore', f"Restored {len(outputs)} outputs and {restored} buttons in {secs:.3f} secs")
+    return {'outputs': len(outputs), 'buttons': restored, 'secs': round(secs, 4)}
+
+def conditional(kinds, build, extra=''):
+    """304 if the client's copy is current (DB change counters), else build() with ETag/Last-Modified"""
+    etag, changed_at = db.data_version(*kinds)
+    if extra:
+        etag = f'{etag}-{extra}'
+    changed_sec = int(changed_at)
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)  # ETag hat Vorrang
+    else:
+        since = request.if_modified_since
+        fresh = since is not None and changed_sec <= int(since.timestamp())
+    if fresh:
+        response = Response(status=304)
+    else:
+        response = make_response(build())
+    response.set_etag(etag)
+    # Last-Modified hat nur Sekunden: bei einer Änderung in dieser Sekunde eine Sekunde früher angeben,
+    # sonst hält der Client eine spätere Änderung in derselben Sekunde für schon bekannt
+    response.last_modified = datetime.fromtimestamp(min(changed_sec, int(_time.time()) - 1), timezone.utc)
+    response.headers['Cache-Control'] = 'no-cache'  # immer nachfragen, 304 ist billig
+    return response
 
 def create_record(deviceID, state):
     """Persist state change"""
@@ -76,22 +312,53 @@ def create_record(deviceID, state):
 
 def switch(pin):
     """Toggle physical device and persist state"""
-    device = db.get_device(pin)
+    device = registry.get_device(pin)
     if device is None:
         return redirect(url_for('error'))
-    LEDC.set.switch(pin)  # Hardware umschalten
-    state = LEDC.get.led(pin)  # neuen Zustand abfragen
-    db.update_device_state_by_pin(pin, state)
+    LEDC.set.switch(pin)  # Hardware umschalten (ein Write)
+    state = LEDC.get.led(pin)  # neuer Zustand aus dem Shadow-Register, kein GPIO-Read
+    registry.update_device_state_by_pin(pin, state)
     create_record(int(device["id"]), state)
+    bus.publish('device', {'pin': pin, 'device_id': device['id'], 'state': bool(state)})  # an offene Dashboards
+
+def switch_room(room_id):
+    """Toggle all outputs of a room at once -> list of new states"""
+    devices = [d for d in registry.get_all_devices_for_room(room_id) if d['device_type_id'] == 1]
+    pins = [int(d['pin']) for d in devices]
+    new_states = LEDC.set.switch_many(pins)  # alle GPIOs in einem Durchlauf
+    changes = [(int(d['id']), int(d['pin']), new_states[int(d['pin'])]) for d in devices]
+    try:
+        registry.apply_device_states(changes)  # State, Logs und History in einer Transaktion
+    except Exception:
+        LEDC.set.switch_many(pins)  # DB-Fehler -> Hardware wieder zurück
+        raise
+    result = []
+    for device_id, pin, state in changes:
+        bus.publish('device', {'pin': pin, 'device_id': device_id, 'state': bool(state)})
+        result.append({'pin': pin, 'device_id': device_id, 'state': bool(state)})
+    return result
+
+def _buttons_applied(batch):
+    """Dispatcher callback: state + history of a batch of button events, then dashboards"""
+    changes = []
+    for event, state in batch:
+        # Geschaltet wird der Output; ist der kein eigenes Gerät, zählt der Button selbst
+        device = registry.get_device(event.output_pin) or registry.get_device(event.input_pin)
+        if device is not None:
+            changes.append((int(device['id']), int(device['pin']), state, event.timestamp))
+    registry.apply_device_states(changes)  # eine Transaktion für den ganzen Batch
+    for event, state in batch:
+        bus.publish('device', {'pin': event.output_pin, 'state': bool(state), 'source': 'button'})
 
 def call_api_info():
     """Init: fetch system IDs of linked APIs"""
-    for api in api_list:
-        print()
-        url = api['url'] + f'/api/info?code=' + api['token']
-        response = requests.get(url)
-        response = json.loads(response.text)[0]
-        api['system_id'] = str(response['system_id'])
+    for api, result in zip(list(api_list), federation.get_all('/api/info')):
+        if result['ok']:
+            api['system_id'] = str(result['data'][0]['system_id'])
+        else:
+            # Peer down -> trotzdem weiterstarten, system_id bleibt leer
+            api.setdefault('system_id', None)
+            print(f"{api['url']} not reachable: {result['error']}")
 
 def get_api(api_id):
     """Hilfsfunktion: API-Objekt anhand System-ID finden"""
@@ -100,52 +367,39 @@ def get_api(api_id):
             return api
     return "[{ 'response': 'error'}]"
 
-db = DBWrapper(config["DEFAULT"]["db_name"])  # SQLite-Wrapper
-db.init_db()
-db.init_tables()
+_latest_sensor = None  # letzter Sensorwert im Speicher
 
 # -------------------------- Web views --------------------------
 @app.route('/')
 def home():
     """Overview: devices grouped by room"""
-    devices = db.get_all_devices()
-    num_rooms = db.get_number_of_rooms()
-    grouped_devices = db.get_all_devices_grouped_by_room()
-    all_buttons = db.get_all_buttons()
-    # Sensor: aktuellen Wert lesen und abspeichern, falls verfügbar
-    current_reading = read_bme680()
-    latest_sensor = None
-    if current_reading.get('available'):
-        try:
-            db.insert_sensor_reading('bme680', current_reading)
-            latest_sensor = current_reading
-        except Exception:
-            latest_sensor = current_reading
-    else:
-        try:
-            latest_sensor = db.get_latest_sensor_reading('bme680')  # fallback auf letzten Wert
-        except Exception:
-            latest_sensor = None
+    # Ein Snapshot aus dem Geräte-Cache statt mehrerer Queries
+    devices, grouped_devices, all_buttons = registry.snapshot()
+    # Sensor: letzter Wert aus dem Speicher (Sampler hält ihn aktuell), kein I2C-Read hier
+    latest_sensor = _latest_sensor
 
     if config['SYSTEM']['connect2api'].strip('"') == "true":
-        # Externe Systeme einbinden (wenn aktiviert)
-        for response in call_all_apis("json"):
+        # Externe Systeme einbinden (wenn aktiviert) – nur aus dem Peer-Cache
+        peer_devices, peer_errors = peer_cache.get()
+        for response in peer_devices:
             devices += response
+        for message in peer_errors:
+            flash(message, 'error')
 
-    return render_template('index.html', devices_by_room=grouped_devices, all_devices=devices, all_button_devices=all_buttons, latest_sensor=latest_sensor)
+    return render_template('index.html', devices_by_room=grouped_devices, all_devices=devices, all_button_devices=all_buttons, latest_sensor=latest_sensor, api_code=access_token)
 
 @app.route('/device/<pin>/')
 def device(pin):
     """Device detail view"""
     pin = int(pin)
-    device = db.get_device(pin)
+    device = registry.get_device(pin)
     if device is None:
         return redirect(url_for('error'))
     try:
         state = int(device["state"])  # state kann None sein -> try/except
     except:
-        db.update_device_state_by_pin(pin, 0)
-    return render_template('device.html', device=device)
+        registry.update_device_state_by_pin(pin, 0)
+    return render_template('device.html', device=device, api_code=access_token)
 
 @app.route('/switch/<pin>/')
 def device_switch(pin):
@@ -158,10 +412,10 @@ def device_switch(pin):
 def unset_pin(pin):
     """Remove device and free pin"""
     pin = int(pin)
-    device = db.get_device(pin)
+    device = registry.get_device(pin)
     if device is None:
         return redirect(url_for('error'))
-    db.remove_device(pin)
+    registry.remove_device(pin)
     LEDC.clear_led(pin)  # GPIO freigeben
     
     flash(f'Pin "{pin}" is now unset and cleand.', 'success')
@@ -174,8 +428,8 @@ def add_device():
     pin = int(request.form.get('pin'))
     device_type = request.form.get('deviceType')
     roomID = int(request.form.get('roomID'))
-    if not db.get_device(pin):
-        db.add_device(device_name, pin, device_type, roomID)  # DB-Eintrag
+    if not registry.get_device(pin):
+        registry.add_device(device_name, pin, device_type, roomID)  # DB-Eintrag
     else:
         flash(f'Error: Pin "{pin}" is already in use.', 'error')
         return redirect(url_for('home'))
@@ -185,7 +439,7 @@ def add_device():
                 flash(f'Device "{device_name}" added successfully.', 'success')
                 pass
             else:
-                db.remove_device(pin)
+                registry.remove_device(pin)
                 flash(f'Error by pin setup "{device_name}" are not created.', 'error')
         else:
             flash("Not implemented yet! Use Add Button to add button devices!")
@@ -204,10 +458,15 @@ def add_button():
     output_pin = int(request.form.get('outputPin'))
     button_type = int(request.form.get('buttonType'))
     device_type = 2
+    if button_type not in BUTTON_TYPES:
+        flash("Button Type does not exist!")
+        return redirect(url_for('home'))
     try:
-        if not db.get_device(input_pin):
+        if not registry.get_device(input_pin):
             # Raum 1000 ist bei uns "virtuell", damit Buttons nicht bei normalen Räumen stören
-            db.add_device(device_name, input_pin, device_type, secondary_pin=output_pin, room_id=1000)
+            # button_type mitspeichern, damit der Button nach einem Neustart wiederhergestellt wird
+            registry.add_device(device_name, input_pin, device_type, secondary_pin=output_pin, room_id=1000,
+                                button_type=button_type)
         else:
             flash(f'Error: Pin "{input_pin}" is already in use.', 'error')
             return redirect(url_for('home'))
@@ -215,15 +474,9 @@ def add_button():
         flash(f"Device type with id {device_type} does not exist", 'error')
         return redirect(url_for('home'))
 
-    if button_type == 1:
-            btn = SwitchButton(input_pin, output_pin)
-            buttons.append(btn)  # switch = toggeln
-    elif button_type == 2:
-            btn = PressButton(input_pin, output_pin)
-            buttons.append(btn)  # press = kurzer HIGH
-    else:
-        flash("Button Type does not exist!")
-        redirect(url_for('home'))
+    # 1 = switch (toggeln), 2 = press (kurzer HIGH)
+    btn = BUTTON_TYPES[button_type](input_pin, output_pin)
+    buttons.append(btn)
     flash(f"Added button {device_name} successfully on pin {input_pin}")
     return redirect("/")
 
@@ -237,18 +490,26 @@ def add_button():
 def room_toggle(roomID):
     """Toggle all devices in room"""
     roomID = int(roomID)
-    devices_in_room = db.get_all_devices_for_room(roomID)
-    for device in devices_in_room:
-        switch(int(device['pin']))  # jedes Device einzeln toggeln
-    
+    try:
+        switch_room(roomID)  # alle Outputs gesammelt toggeln
+    except Exception as e:
+        flash(f'Room {roomID} could not be switched: {e}', 'error')
     return redirect("/")
 
 @app.route('/stats')
 def stats():
     """Statistics / history"""
-    stats = db.get_num_state_updates()
-    history = db.get_history()
-    return render_template("stats.html", stats=stats, history_by_minute=history, api_code=access_token)
+    before = request.args.get('before', type=int)  # Cursor für ältere Einträge
+
+    def build():
+        stats = db.get_num_state_updates()
+        page = db.get_history_page(HISTORY_PAGE_SIZE, before_id=before)
+        return render_template("stats.html", stats=stats, history_by_minute=page["history"],
+                               next_cursor=page["next_cursor"], is_first_page=before is None, api_code=access_token)
+
+    if session.get('_flashes'):
+        return build()  # offene Flash-Meldungen -> Seite ist nicht nur von der DB abhängig
+    return conditional(('history', 'device'), build)
 
 @app.route('/sensors')
 def sensors_view():
@@ -267,30 +528,58 @@ def error():
 #--------------------------------------------------------------
 # call_api's
 
+def _fetch_all_apis(url_part):
+    """Query all connected APIs (GET) -> (responses, error messages)"""
+    full_response = []
+    errors = []
+    results = federation.get_all(f'/api/get/{url_part}')  # alle Peers parallel
+    for result in results:
+        if result['ok']:
+            full_response += [result['data']]
+        elif result['status'] == 401:
+            errors.append('"'+ result['url'] +'" Authorisation failed')
+        else:
+            errors.append(result['url'] + ' is not available')
+    return full_response, errors
+
 def call_all_apis(url_part):
     """Query all connected APIs (GET)"""
     if api_active == True:
-        full_response = []
-        for api in api_list:
-            try:
-                url = api['url'] + f'/api/get/{url_part}?code=' + api['token']
-                response = requests.get(url)
-                if str(response) == "<Response [401]>":
-                    flash( '"'+ api['url'] +'" Authorisation failed', 'error')
-                else:
-                    full_response += [json.loads(response.text)]  # API liefert JSON als String
-            except:
-                flash(api['url'] + ' is not available', 'error')
-                pass
-            
+        full_response, errors = _fetch_all_apis(url_part)
+        for message in errors:
+            flash(message, 'error')
         return full_response
+
+# Peer-Cache zusätzlich regelmäßig im Hintergrund auffrischen
+_peer_thread_started = False
+
+def _peer_refresh_loop(interval_sec: int = 30):
+    while True:
+        try:
+            peer_cache.refresh_all(wait=True)
+        except Exception:
+            pass
+        _time.sleep(interval_sec)
+
+def _maybe_start_peer_refresh():
+    global _peer_thread_started
+    if _peer_thread_started or not api_active or config['SYSTEM']['connect2api'].strip('"') != "true":
+        return
+    try:
+        interval = int(config['DEFAULT'].get('peer_refresh', '30').strip('"') or 30)
+    except Exception:
+        interval = 30
+    th = threading.Thread(target=_peer_refresh_loop, args=(interval,), daemon=True)
+    th.start()
+    _peer_thread_started = True
     
 def call_api(url_part, use_api):
     """Single API request"""
-    if api_active == True:
-        url = use_api['url'] + f'/api/{url_part}?code=' + use_api['token']
-        response = json.loads(requests.get(url).text)[0]
-        return response
+    if api_active == True and isinstance(use_api, dict):
+        result = federation.get(use_api, f'/api/{url_part}')
+        if not result['ok']:
+            return None  # Aufrufer zeigt dann die Fehlerseite
+        return result['data'][0]
 
 @app.route('/api/device/<pin>/', methods=['GET'])
 def call_api_device(pin):
@@ -298,6 +587,9 @@ def call_api_device(pin):
     api_id = request.args.get('system_id')
     api_call = get_api(api_id)
     response = call_api(f"get/device/{pin}", api_call)
+    if response is None:
+        flash('Remote system is not available', 'error')
+        return redirect(url_for('error'))
     return render_template('device.html', device=response)
     
 
@@ -307,6 +599,9 @@ def call_api_device_switch(pin):
     api_id = request.args.get('system_id')
     api_call = get_api(api_id)
     response = call_api(f"set/switch/{pin}", api_call)
+    if response is None:
+        flash('Remote system is not available', 'error')
+        return redirect(url_for('error'))
     return redirect("/api/device/{pin}?system_id={sid}".format(pin=response["pin"], sid=response["system_id"]))
 
 @app.route('/api/unset/<pin>/', methods=['GET'])
@@ -315,7 +610,8 @@ def call_unset_device(pin):
     api_id = request.args.get('system_id')
     api_call = get_api(api_id)
     pin = int(pin)
-    if call_api(f"set/unset/{pin}", api_call)['response'] == 'success':
+    response = call_api(f"set/unset/{pin}", api_call)
+    if response is not None and response.get('response') == 'success':
         flash(f'Pin "{pin}" removed successfully.', 'success')
     else:
         flash(f'Pin "{pin}" could not be removed.', 'error')
@@ -342,14 +638,21 @@ def home_json():
     """API: all devices (JSON)"""
     code = request.args.get('code')
     if auth_check(code):
-        devices = FA.get_devices()
-        for device in devices:
-            try:
-                device['state'] = LEDC.state(device['pin'])  # GPIO-State mitgeben
-            except:
-                device['state'] = False
-            device['system_id'] = system_id
-        return devices
+        def build():
+            devices = FA.get_devices()
+            for device in devices:
+                try:
+                    device['state'] = LEDC.state(device['pin'])  # GPIO-State mitgeben
+                except:
+                    device['state'] = False
+                device['system_id'] = system_id
+            return devices
+        try:
+            file_version = os.stat('device.json').st_mtime_ns  # Geräteliste kommt (noch) aus device.json
+        except OSError:
+            file_version = 0
+        # Zustände ändern sich nur mit einem device-Write (switch, Buttons, Reconcile)
+        return conditional(('device',), build, extra=file_version)
     else:
         abort(401)
 
@@ -371,22 +674,137 @@ def api_device_switch(pin):
     code = request.args.get('code')
     if auth_check(code):
         pin = int(pin)
-        device = db.get_device(pin)
+        device = registry.get_device(pin)
         if device is None:
             return '[{ "state": false}]'
-        LEDC.set.switch(pin)  # Hardware toggeln
+        switch(pin)  # Hardware toggeln + State/History speichern (wie in der UI)
         return '[{ "pin": '+str(pin)+', "system_id": "'+system_id+'" }]'
     return "[{ 'error': 'Authorisation failed' }]"
 
+@app.route('/api/room/<roomID>/toggle')
+def api_room_toggle(roomID):
+    """API: toggle all outputs of a room, returns new states"""
+    code = request.args.get('code')
+    if not auth_check(code):
+        abort(401)
+    try:
+        return jsonify(switch_room(int(roomID)))
+    except ValueError:
+        abort(400)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history')
+def api_history():
+    """API: device history page (from/to as unix timestamps, before = cursor)"""
+    code = request.args.get('code')
+    if not auth_check(code):
+        abort(401)
+    try:
+        limit = max(1, min(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1000))  # 0/negativ wäre ungültig bzw. unbegrenzt
+        before = int(request.args['before']) if request.args.get('before') else None
+        ts_from = int(request.args['from']) if request.args.get('from') else None
+        ts_to = int(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        abort(400)
+    return conditional(('history', 'device'), lambda: jsonify(db.get_history_page(limit, before, ts_from, ts_to)))
+
+@app.route('/api/stats/counters')
+def api_stats_counters():
+    """API: history counters (total, per device, per room, per day)"""
+    code = request.args.get('code')
+    if not auth_check(code):
+        abort(401)
+    days = request.args.get('days', 30, type=int)
+    return conditional(('history', 'device'), lambda: jsonify(db.get_history_counters(days)))
+
+@app.route('/api/stats/usage')
+def api_stats_usage():
+    """API: on-time, switch count and duty cycle per device (resolution hour|day, from/to as unix timestamps)"""
+    code = request.args.get('code')
+    if not auth_check(code):
+        abort(401)
+    try:
+        resolution = request.args.get('resolution', 'day')
+        ts_from = int(request.args['from']) if request.args.get('from') else None
+        ts_to = int(request.args['to']) if request.args.get('to') else None
+        device_id = int(request.args['device']) if request.args.get('device') else None
+        # Kein ETag: eingeschaltete Geräte sammeln auch ohne DB-Änderung weiter Ein-Zeit
+        return jsonify(db.get_device_usage(resolution, ts_from, ts_to, device_id))
+    except ValueError:
+        abort(400)
+
+@app.route('/api/stats/usage/rebuild', methods=['POST'])
+def api_stats_usage_rebuild():
+    """API: recompute the usage summaries from the stored history"""
+    code = request.args.get('code')
+    if not auth_check(code):
+        abort(401)
+    devices = db.rebuild_device_usage()
+    db.write_log('info', 'usage_rebuild', f"Rebuilt usage summaries for {devices} devices")
+    return jsonify({'devices': devices})
+
+@app.route('/api/events')
+def api_events():
+    """API: Server-Sent Events stream (device state + sensor samples)"""
+    code = request.args.get('code')
+    if not auth_check(code):
+        abort(401)
+    q = bus.subscribe()  # vor dem Antworten anmelden, damit nichts verloren geht
+    response = Response(bus.stream(q), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # kein Buffering hinter nginx
+    response.call_on_close(lambda: bus.unsubscribe(q))
+    return response
+
+@app.route('/api/startup')
+def api_startup():
+    """API: startup phase timing breakdown"""
+    code = request.args.get('code')
+    if not auth_check(code):
+        abort(401)
+    return jsonify(startup_timer.as_dict())
+
+@app.route('/metrics')
+def metrics_view():
+    """Prometheus text format (per process)"""
+    code = request.args.get('code')
+    if not auth_check(code):
+        abort(401)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/peers')
+def api_peer_status():
+    """API: cache and circuit-breaker state of every linked system"""
+    code = request.args.get('code')
+    if not auth_check(code):
+        abort(401)
+    return jsonify(peer_cache.status())
+
+@app.route('/api/cache/devices')
+def api_device_cache_stats():
+    """API: device registry hit/miss counters"""
+    code = request.args.get('code')
+    if not auth_check(code):
+        abort(401)
+    return jsonify(registry.stats())
+
 @app.route('/api/sensors/bme680')
 def api_sensor_bme680():
     code = request.args.get('code')
     if not auth_check(code):
         abort(401)
-    reading = read_bme680()
-    if reading.get('available'):
+    global _latest_sensor
+    try:
+        # ?max_age=5 -> Wert aus dem Cache, wenn er höchstens 5 s alt ist
+        max_age = float(request.args.get('max_age', 0))
+    except ValueError:
+        abort(400)
+    reading = read_bme680(max_age=max_age)
+    if reading.get('available') and not reading.get('cached'):
+        _latest_sensor = reading
         try:
-            db.insert_sensor_reading('bme680', reading)
+            db.insert_sensor_reading('bme680', reading, store_raw=sensor_filter.accept)
         except Exception:
             pass
     return jsonify(reading)
@@ -400,34 +818,160 @@ def api_sensor_bme680_history():
         limit = int(request.args.get('limit', 300))
     except Exception:
         limit = 300
-    items = db.get_sensor_history('bme680', limit)
-    return jsonify(items)
-
-_sensor_thread_started = False
+    try:
+        # from/to als Unix-Timestamps, resolution = raw|minute|hour|day|auto
+        ts_from = int(request.args['from']) if request.args.get('from') else None
+        ts_to = int(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        abort(400)
+    resolution = request.args.get('resolution')
+    export_format = request.args.get('format', 'rows')
+    if export_format != 'rows':
+        if export_format not in EXPORT_FORMATS:
+            abort(400)
+        # Ende/Auflösung hier festlegen: ohne "to" hängen beide an der Uhrzeit -> gehören ins ETag
+        ts_to = ts_to if ts_to is not None else int(_time.time())
+        ts_from = ts_from if ts_from is not None else 0
+        if resolution in (None, 'auto'):
+            resolution = db.pick_sensor_resolution(ts_to - ts_from, limit, _sensor_interval()) if resolution else 'raw'
+        try:
+            db.sensor_export_columns(resolution)
+        except ValueError:
+            abort(400)
+        use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+        build = lambda: _sensor_history_export(export_format, ts_from, ts_to, resolution, use_gzip)
+        # gzip und unkomprimiert sind verschiedene Bytes -> eigenes ETag je Encoding
+        response = conditional(('sensor',), build, f"{resolution}-{ts_to}-{'gzip' if use_gzip else 'identity'}")
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
 
-def _sensor_sampler_loop(interval_sec: int = 10):
+    if ts_from is None and ts_to is None and resolution not in (None, 'raw'):
+        # Fenster "die letzten N Buckets bis jetzt" wandert mit der Zeit -> kein ETag
+        try:
+            return jsonify(db.get_sensor_history('bme680', limit, ts_from, ts_to, resolution, _sensor_interval()))
+        except ValueError:
+            abort(400)  # unbekannte Auflösung
+    extra = ''
+    if ts_from is not None and resolution in (None, 'auto'):
+        # Gewählte Stufe hängt ohne "to" an der Uhrzeit -> ins ETag
+        span = (ts_to if ts_to is not None else int(_time.time())) - ts_from
+        extra = db.pick_sensor_resolution(span, limit, _sensor_interval())
+
+    def build():
+        try:
+            return jsonify(db.get_sensor_history('bme680', limit, ts_from, ts_to, resolution, _sensor_interval()))
+        except ValueError:
+            abort(400)  # unbekannte Auflösung
+    return conditional(('sensor',), build, extra)
+
+EXPORT_FORMATS = {
+    # format -> (Generator, Mimetype, Dateiendung)
+    'columns': (None, 'application/json', None),
+    'csv': (sensor_export.csv_stream, 'text/csv', 'csv'),
+    'binary': (sensor_export.packed_binary, 'application/octet-stream', 'bin'),
+}
+
+def _sensor_history_export(export_format, ts_from, ts_to, resolution, use_gzip):
+    """Streamed export (columnar JSON, CSV, packed binary) for an already resolved range and tier"""
+    encoder, mimetype, extension = EXPORT_FORMATS[export_format]
+
+    def generate():
+        # Reader-Verbindung bleibt nur so lange offen, wie der Client liest
+        with db.sensor_export('bme680', ts_from, ts_to, resolution) as (columns, chunks):
+            if encoder is None:
+                meta = {'sensor_type': 'bme680', 'resolution': resolution, 'from': ts_from, 'to': ts_to}
+                parts = sensor_export.columnar_json(columns, chunks, meta)
+            else:
+                parts = encoder(columns, chunks)
+            if use_gzip:
+                parts = sensor_export.gzip_stream(parts)
+            for part in parts:
+                yield part
+
+    response = Response(generate(), mimetype=mimetype)
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    if extension:
+        response.headers['Content-Disposition'] = f'attachment; filename=bme680-{resolution}-{ts_from}-{ts_to}.{extension}'
+    return response
+
+_reconcile_thread_started = False
+
+def _gpio_reconcile_loop(interval_sec: int = 60):
+    """Shadow register vs. hardware; drift -> registry, history and dashboards"""
     while True:
+        _time.sleep(interval_sec)
         try:
-            reading = read_bme680()
-            if reading.get('available'):
-                db.insert_sensor_reading('bme680', reading)
-        except Exception:
-            pass
-        _time.sleep(interval_sec)  # Pause zwischen den Messungen
+            drifted = LEDC.reconcile()
+        except Exception as e:
+            print(f"GPIO reconcile failed: {e}")
+            continue
+        for pin, state in drifted.items():
+            device = registry.get_device(pin)
+            if device is None:
+                continue  # z.B. Button-Output ohne Geräteeintrag
+            db.write_log('warning', 'gpio_drift', f"Pin {pin} is {'HIGH' if state else 'LOW'}, expected the opposite", int(device['id']))
+            registry.update_device_state_by_pin(pin, state)
+            create_record(int(device['id']), state)
+            bus.publish('device', {'pin': pin, 'device_id': device['id'], 'state': bool(state), 'source': 'reconcile'})
+
+def _maybe_start_gpio_reconcile():
+    global _reconcile_thread_started
+    if _reconcile_thread_started:
+        return
+    try:
+        interval = int(config['DEFAULT'].get('gpio_reconcile', '60').strip('"') or 60)
+    except ValueError:
+        interval = 60
+    if interval <= 0:
+        return  # 0 = abgeschaltet
+    th = threading.Thread(target=_gpio_reconcile_loop, args=(interval,), name="gpio-reconcile", daemon=True)
+    th.start()
+    _reconcile_thread_started = True
+
+sensor_scheduler = None  # läuft nur im Hardware-Besitzer
+
+def _sensor_interval():
+    """Sampler interval in seconds (.conf: sensor_interval)"""
+    try:
+        return int(config['DEFAULT'].get('sensor_interval', '10').strip('"') or 10)
+    except Exception:
+        return 10
+
+def _store_sensor_samples(samples):
+    """Scheduler callback: all samples of one tick -> one DB write, then dashboards"""
+    global _latest_sensor
+    # Rollups bekommen jeden Wert, die Rohtabelle nur bei relevanter Änderung/Heartbeat;
+    # Dashboards bekommen jeden Wert
+    db.insert_sensor_readings(samples, store_raw=sensor_filter.accept)
+    for sensor_type, reading in samples:
+        if sensor_type == 'bme680':
+            _latest_sensor = reading  # für home(), ohne eigenen Sensor-Read
+        bus.publish('sensor', dict(reading, sensor_type=sensor_type))
 
 def _maybe_start_sampler():
-    global _sensor_thread_started
-    if _sensor_thread_started:
+    global sensor_scheduler
+    if sensor_scheduler is not None:
         return  # läuft schon
-    if app.debug and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
-        return  # verhindert doppelten Thread im Debug-Reload
     try:
-        interval = int(config['DEFAULT'].get('sensor_interval', '10').strip('"') or 10)
-    except Exception:
-        interval = 10
-    th = threading.Thread(target=_sensor_sampler_loop, args=(interval,), daemon=True)
-    th.start()
-    _sensor_thread_started = True
+        max_backoff = float(config['DEFAULT'].get('sensor_max_backoff', '300').strip('"') or 300)
+    except ValueError:
+        max_backoff = 300.0
+    sensor_scheduler = SensorScheduler(_store_sensor_samples, max_backoff=max_backoff)
+    # Weitere Sensoren: register(name, read_fn, interval) - read_fn liefert ein Dict mit "available"
+    sensor_scheduler.register('bme680', read_bme680, _sensor_interval())
+    sensor_scheduler.start()
+
+@app.route('/api/sensors/status')
+def api_sensor_status():
+    """API: scheduler state per sensor (interval, failures, next read)"""
+    code = request.args.get('code')
+    if not auth_check(code):
+        abort(401)
+    return jsonify({
+        'sensors': sensor_scheduler.stats() if sensor_scheduler is not None else [],
+        'deadband': sensor_filter.stats(),
+    })
 
 @app.route('/api/set/unset/<pin>')
 def api_set_unset_device(pin):
@@ -446,11 +990,27 @@ def api_set_unset_device(pin):
 
 #--------------------------------------------------------------
 
-call_api_info()
-
 def start():
-    """Start Flask (externally callable)"""
-    _maybe_start_sampler()
-    app.run(debug=True, port=config['DEFAULT']['port'].strip('"'), host='0.0.0.0')
+    """Start Flask dev server (externally callable)"""
+    create_app()
+    debug = config['DEFAULT'].get('debug', 'false').strip('"') == "true"
+    # Kein Reloader: der würde den Prozess (inkl. GPIO und Threads) doppelt starten
+    app.run(debug=debug, use_reloader=False, threaded=True, port=config['DEFAULT']['port'].strip('"'), host='0.0.0.0')
+
+def serve():
+    """Production server: multi-threaded WSGI (waitress if installed)"""
+    create_app()
+    port = int(config['DEFAULT']['port'].strip('"'))
+    threads = int(config['DEFAULT'].get('threads', '16').strip('"') or 16)  # SSE-Clients belegen je einen Thread
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        waitress_serve = None
+    if waitress_serve is not None:
+        waitress_serve(app, host='0.0.0.0', port=port, threads=threads)
+    else:
+        from werkzeug.serving import run_simple
+        run_simple('0.0.0.0', port, app, threaded=True, use_reloader=False, use_debugger=False)
 
-start()  # direkt starten, wenn Datei ausgeführt/importiert wird
+if __name__ == '__main__':
+    start()
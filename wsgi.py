@@ -0,0 +1,6 @@
+from webserver import create_app
+
+# WSGI-Einstieg für externe Server (gunicorn, uWSGI, ...), z.B.:
+#   gunicorn wsgi:application   (Einstellungen aus gunicorn.conf.py)
+# Genau ein Worker mit Threads: ein zweiter Prozess bekommt den Hardware-Lock nicht und bricht ab.
+application = create_app()